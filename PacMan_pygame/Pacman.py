@@ -1,10 +1,28 @@
-import pygame
 import numpy as np
-import tcod
 import random
+import hashlib
+import importlib
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
 
 
+class LazyModule:
+    # модуль импортируется при первом обращении к атрибуту и дальше подставляется вместо заглушки
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.name)
+        globals()[self.name] = module
+        return getattr(module, attr)
+
+
+# безголовым процессам окно и A* не нужны, поэтому pygame и tcod грузятся только по требованию
+pygame = LazyModule("pygame")
+tcod = LazyModule("tcod")
+
+
 class Score(Enum):
     COOKIE = 10
     POWERUP = 50
@@ -23,18 +41,33 @@ class Movement(Enum):
     NONE = 360
 
 
+# (scatter, chase) в секундах для каждой фазы
+MODE_SCHEDULE = [
+    (7, 99999),
+    (7, 100),
+    (5, 100),
+    (5, 999999)
+]
+POWERUP_SECONDS = 10
+
+
 class GameObj:
+    __slots__ = ('_size', 'renderer', 'x', 'y', '_color', '_circle', '_shape')
+
     def __init__(self, surface, x, y,
                  size: int, color=(255, 0, 0),
                  is_circle: bool = False):
         self._size = size
-        self.renderer: Render = surface
-        self.surface = surface.screen
+        self.renderer: Simulation = surface
         self.y = y
         self.x = x
         self._color = color
         self._circle = is_circle
-        self._shape = pygame.Rect(self.x, self.y, size, size)
+        self._shape = None  # Rect создается при первой отрисовке
+
+    @property
+    def surface(self):
+        return self.renderer.screen
 
     def draw(self):
         if self._circle:
@@ -53,7 +86,11 @@ class GameObj:
         pass
 
     def get_shape(self):
-        return pygame.Rect(self.x, self.y, self._size, self._size)
+        # один Rect на объект, обновляется на месте
+        if self._shape is None:
+            self._shape = pygame.Rect(self.x, self.y, self._size, self._size)
+        self._shape.update(self.x, self.y, self._size, self._size)
+        return self._shape
 
     def set_position(self, x, y):
         self.x = x
@@ -64,26 +101,380 @@ class GameObj:
 
 
 class Wall(GameObj):
-    def __init__(self, surface, x, y, size: int, color=(0, 0, 255)):
+    __slots__ = ()
+    color = (0, 0, 255)
+
+    def __init__(self, surface, x, y, size: int, color=color):
         super().__init__(surface, x * size, y * size, size, color)
 
 
-class Render:
-    def __init__(self, width: int, height: int):
-        pygame.init()
+class AssetCache:
+    def __init__(self):
+        self.images = {}
+        self.sprites = {}
+        self.fonts = {}
+        self.texts = {}
+        self.max_texts = 128
+
+    def image(self, path):
+        if path not in self.images:
+            self.images[path] = pygame.image.load(path)
+        return self.images[path]
+
+    def sprite(self, path, size: int, direction: Movement = Movement.RIGHT):
+        key = (path, size, direction)
+        if key not in self.sprites:
+            self.preload_sprite(path, size)
+        return self.sprites[key]
+
+    def load_atlas(self, paths, size: int):
+        # все спрайты одного размера в одной поверхности, по строке на картинку и по столбцу на направление
+        paths = [path for path in dict.fromkeys(paths)]
+        directions = list(Movement)
+        atlas = pygame.Surface((size * len(directions), size * len(paths)), pygame.SRCALPHA)
+        for row, path in enumerate(paths):
+            scaled = pygame.transform.scale(self.image(path), (size, size))
+            for col, direction in enumerate(directions):
+                atlas.blit(pygame.transform.rotate(scaled, direction.value), (col * size, row * size))
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        for row, path in enumerate(paths):
+            for col, direction in enumerate(directions):
+                self.sprites[(path, size, direction)] = atlas.subsurface((col * size, row * size, size, size))
+        return atlas
+
+    def preload_sprite(self, path, size: int):
+        # масштабируем исходник один раз и поворачиваем уже маленькую картинку
+        scaled = pygame.transform.scale(self.image(path), (size, size))
+        for direction in Movement:
+            self.sprites[(path, size, direction)] = pygame.transform.rotate(scaled, direction.value)
+
+    def font(self, size: int):
+        if size not in self.fonts:
+            self.fonts[size] = pygame.font.SysFont('Arial', size)
+        return self.fonts[size]
+
+    def text(self, text, size: int, color=(255, 255, 255)):
+        key = (text, size, color)
+        if key not in self.texts:
+            if len(self.texts) >= self.max_texts:
+                self.texts.clear()
+            self.texts[key] = self.font(size).render(text, False, color)
+        return self.texts[key]
+
+
+assets = AssetCache()
+
+
+class CollisionGrid:
+    def __init__(self, maze, tile_size: int = 32):
+        self.tile_size = tile_size
+        # True там, где стена; maze[y][x] == 0
+        self.walls = np.array(maze, dtype=np.int8) == 0
+        self.height, self.width = self.walls.shape
+
+    def collides(self, x, y, width: int, height: int) -> bool:
+        first_col = max(int(x // self.tile_size), 0)
+        first_row = max(int(y // self.tile_size), 0)
+        last_col = min(int(-(-(x + width) // self.tile_size)), self.width)
+        last_row = min(int(-(-(y + height) // self.tile_size)), self.height)
+        if first_col >= last_col or first_row >= last_row:
+            return False
+        return bool(self.walls[first_row:last_row, first_col:last_col].any())
+
+    def is_wall(self, col: int, row: int) -> bool:
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return bool(self.walls[row, col])
+        return False
+
+
+class PelletStore:
+    def __init__(self, columns: int, rows: int, tile_size: int = 32):
+        self.tile_size = tile_size
+        self.cookies = np.zeros((rows, columns), dtype=np.bool_)
+        self.powerups = np.zeros((rows, columns), dtype=np.bool_)
+        self.cookie_count = 0
+
+    def load(self, cookies, powerups):
+        self.cookies = np.array(cookies, dtype=np.bool_)
+        self.powerups = np.array(powerups, dtype=np.bool_)
+        self.cookie_count = int(self.cookies.sum())
+
+    def freeze(self):
+        # копирование при записи: снимок и магазин делят массивы, пока кто-то не съест очко
+        self.cookies.flags.writeable = False
+        self.powerups.flags.writeable = False
+        return self.cookies, self.powerups, self.cookie_count
+
+    def thaw(self, cookies, powerups, cookie_count: int):
+        self.cookies = cookies
+        self.powerups = powerups
+        self.cookie_count = cookie_count
+
+    def writable_cookies(self):
+        if not self.cookies.flags.writeable:
+            self.cookies = self.cookies.copy()
+        return self.cookies
+
+    def writable_powerups(self):
+        if not self.powerups.flags.writeable:
+            self.powerups = self.powerups.copy()
+        return self.powerups
+
+    def cell_of(self, obj: GameObj):
+        return int(obj.x // self.tile_size), int(obj.y // self.tile_size)
+
+    def center_of(self, col: int, row: int):
+        half = self.tile_size // 2
+        return col * self.tile_size + half, row * self.tile_size + half
+
+    def contains(self, col: int, row: int) -> bool:
+        rows, columns = self.cookies.shape
+        return 0 <= col < columns and 0 <= row < rows
+
+    def add_cookie(self, obj: GameObj):
+        col, row = self.cell_of(obj)
+        if self.contains(col, row) and not self.cookies[row, col]:
+            self.writable_cookies()[row, col] = True
+            self.cookie_count += 1
+
+    def add_powerup(self, obj: GameObj):
+        col, row = self.cell_of(obj)
+        if self.contains(col, row):
+            self.writable_powerups()[row, col] = True
+
+    def eat_cookie(self, col: int, row: int) -> bool:
+        if not self.cookies[row, col]:
+            return False
+        self.writable_cookies()[row, col] = False
+        self.cookie_count -= 1
+        return True
+
+    def eat_powerup(self, col: int, row: int) -> bool:
+        if not self.powerups[row, col]:
+            return False
+        self.writable_powerups()[row, col] = False
+        return True
+
+    def cookies_left(self) -> int:
+        return self.cookie_count
+
+    def cookies_under(self, x, y, width: int, height: int):
+        return self.collect_under(self.cookies, Point.size, x, y, width, height)
+
+    def powerups_under(self, x, y, width: int, height: int):
+        return self.collect_under(self.powerups, Powerup.size, x, y, width, height)
+
+    def collect_under(self, pellets, pellet_size: int, x, y, width: int, height: int):
+        # очко лежит внутри своей клетки, так что достаточно клеток под прямоугольником
+        found = []
+        rows, columns = pellets.shape
+        first_col = max(int(x // self.tile_size), 0)
+        first_row = max(int(y // self.tile_size), 0)
+        last_col = min(int(-(-(x + width) // self.tile_size)), columns)
+        last_row = min(int(-(-(y + height) // self.tile_size)), rows)
+        for row in range(first_row, last_row):
+            for col in range(first_col, last_col):
+                if not pellets[row, col]:
+                    continue
+                center_x, center_y = self.center_of(col, row)
+                if rects_overlap(x, y, width, height, center_x, center_y, pellet_size, pellet_size):
+                    found.append((col, row))
+        return found
+
+    def cookie_cells(self):
+        return [(col, row) for row, col in np.argwhere(self.cookies)]
+
+    def powerup_cells(self):
+        return [(col, row) for row, col in np.argwhere(self.powerups)]
+
+
+def rects_overlap(ax, ay, a_width, a_height, bx, by, b_width, b_height) -> bool:
+    return ax < bx + b_width and bx < ax + a_width and ay < by + b_height and by < ay + a_height
+
+
+class SpatialHash:
+    def __init__(self, cell_size: int = 32):
+        self.cell_size = cell_size
+        self.buckets = {}  # (col, row) -> set of objects
+        self.cells = {}  # object -> (col, row)
+        self.max_size = cell_size
+
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def insert(self, obj: GameObj):
+        cell = self.cell_of(obj.x, obj.y)
+        self.buckets.setdefault(cell, set()).add(obj)
+        self.cells[obj] = cell
+        self.max_size = max(self.max_size, obj._size)
+
+    def remove(self, obj: GameObj):
+        cell = self.cells.pop(obj, None)
+        if cell is None:
+            return
+        bucket = self.buckets[cell]
+        bucket.discard(obj)
+        if not bucket:
+            del self.buckets[cell]
+
+    def move(self, obj: GameObj):
+        old_cell = self.cells.get(obj)
+        if old_cell is None:
+            return
+        cell = self.cell_of(obj.x, obj.y)
+        if cell != old_cell:
+            self.remove(obj)
+            self.insert(obj)
+
+    def __contains__(self, obj):
+        return obj in self.cells
+
+    def clear(self):
+        self.buckets = {}
+        self.cells = {}
+
+    def query(self, x, y, width: int, height: int):
+        # объекты хранятся по левому верхнему углу, поэтому захватываем соседние корзины слева и сверху
+        margin = -(-self.max_size // self.cell_size)
+        first_col, first_row = self.cell_of(x, y)
+        last_col, last_row = self.cell_of(x + width, y + height)
+        found = []
+        for row in range(first_row - margin, last_row + 1):
+            for col in range(first_col - margin, last_col + 1):
+                for obj in self.buckets.get((col, row), ()):
+                    if rects_overlap(x, y, width, height, obj.x, obj.y, obj._size, obj._size):
+                        found.append(obj)
+        return found
+
+
+SNAPSHOT_SCALARS = ('ticks', 'started', 'won', 'lives', 'score', 'powerup_active', 'current_mode',
+                    'current_phase', 'mode_switch_tick', 'powerup_end_tick')
+# столбцы упакованного состояния подвижных объектов в Snapshot.entities
+ENTITY_FIELDS = ('x', 'y', 'current_direction', 'direction_buff', 'last_direction',
+                 'has_target', 'target_x', 'target_y', 'queue_length')
+
+
+class Snapshot:
+    # состояние партии в плоских массивах; массивы только для чтения, так что снимок можно восстанавливать много раз
+    __slots__ = ('ticks', 'started', 'won', 'lives', 'score', 'powerup_active', 'current_mode', 'current_phase',
+                 'mode_switch_tick', 'powerup_end_tick', 'pellets', 'game_objects', 'movables', 'pacman',
+                 'pacman_state', 'entities', 'queues', 'rng_state', 'planner_jobs')
+
+    def __init__(self, simulation):
+        for name in SNAPSHOT_SCALARS:
+            setattr(self, name, getattr(simulation, name))
+        self.pellets = simulation.pellets.freeze()
+        # сами объекты не копируются, только ссылки на них и их поля
+        self.game_objects = tuple(simulation.game_objects)
+        self.movables = tuple(simulation.movables)
+        self.pacman = simulation.pacman
+        self.pacman_state = None
+        if self.pacman is not None:
+            self.pacman_state = (self.pacman.last_notcolliding_position, self.pacman.mouth_open)
+
+        self.entities = np.zeros((len(self.movables), len(ENTITY_FIELDS)), dtype=np.int32)
+        queues = []
+        for row, movable in zip(self.entities, self.movables):
+            target = movable.next_target
+            row[:] = (movable.x, movable.y, movable.current_direction.value, movable.direction_buff.value,
+                      movable.last_direction.value, target is not None, *(target or (0, 0)),
+                      len(movable.location_queue))
+            queues.extend(movable.location_queue)
+        self.queues = np.array(queues, dtype=np.int32).reshape(-1, 2)
+        self.entities.flags.writeable = False
+        self.queues.flags.writeable = False
+        # генератор партии выбирает цели блуждания, без него повтор ходов расходится
+        self.rng_state = simulation.rng.getstate() if simulation.rng is not None else None
+        self.planner_jobs = simulation.planner.resolve() if simulation.planner is not None else ()
+
+    def apply(self, simulation):
+        for name in SNAPSHOT_SCALARS:
+            setattr(simulation, name, getattr(self, name))
+        simulation.pellets.thaw(*self.pellets)
+        simulation.game_objects = list(self.game_objects)
+        simulation.movables = list(self.movables)
+        simulation.pacman = self.pacman
+        if self.pacman is not None:
+            self.pacman.last_notcolliding_position, self.pacman.mouth_open = self.pacman_state
+
+        spatial_hash = simulation.get_spatial_hash()
+        spatial_hash.clear()
+        offset = 0
+        for movable, (x, y, current, buff, last, has_target, target_x, target_y, length) \
+                in zip(self.movables, self.entities.tolist()):
+            movable.x = x
+            movable.y = y
+            movable.current_direction = Movement(current)
+            movable.direction_buff = Movement(buff)
+            movable.last_direction = Movement(last)
+            movable.next_target = (target_x, target_y) if has_target else None
+            movable.location_queue = [tuple(cell) for cell in self.queues[offset:offset + length].tolist()]
+            offset += length
+            spatial_hash.insert(movable)
+        if self.rng_state is not None:
+            simulation.rng.setstate(self.rng_state)
+        if simulation.planner is not None:
+            simulation.planner.load(self.planner_jobs)
+
+    def digest(self) -> int:
+        digest = hashlib.blake2b(digest_size=8)
+        scalars = tuple(getattr(self, name) for name in SNAPSHOT_SCALARS)
+        digest.update(repr((scalars, self.pacman_state, self.rng_state)).encode())
+        slots = {movable: slot for slot, movable in enumerate(self.movables)}
+        for ghosts, paths in self.planner_jobs:
+            digest.update(repr((tuple(slots.get(ghost, -1) for ghost in ghosts), paths)).encode())
+        for array in (*self.pellets[:2], self.entities, self.queues):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return int.from_bytes(digest.digest(), "little")
+
+
+MOVEMENT_INDEX = {direction: index for index, direction in enumerate(Movement)}
+
+
+class SimulationObserver:
+    # события Simulation с пустыми обработчиками; наследник переопределяет только нужные
+    def on_step(self, simulation):
+        pass
+
+    def on_add(self, obj):
+        pass
+
+    def on_remove(self, obj):
+        pass
+
+    def on_pellet_eaten(self, cell, powerup: bool):
+        # на клетке O лежат и очко, и энерджайзер, и съесть можно только одно из них
+        pass
+
+    def on_reset(self, simulation):
+        # очки или вся партия заменены целиком: после load_pellets и restore
+        pass
+
+
+class Simulation:
+    def __init__(self, width: int, height: int, tick_rate: int = 120):
         self.width = width
         self.height = height
-        self.screen = pygame.display.set_mode((width, height))
-        pygame.display.set_caption('Pacman')
-        self.clock = pygame.time.Clock()
-        self.done = False
+        self.screen = None  # появляется, только если подключен Render
+        self.tick_rate = tick_rate
+        self.ticks = 0
+        self.started = False
         self.won = False
+        self.last_action = None  # ввод последнего шага, его читает запись повтора
+        self.observers = []
         self.game_objects = []
+        self.movables = []
         self.walls = []
-        self.cookies = []
-        self.powerups = []
+        self.pellets = PelletStore(-(-width // 32), -(-height // 32))
+        self.spatial_hash = SpatialHash()
         self.ghosts = []
         self.pacman: Pacman = None
+        self.pacman_spawn = (32, 32)
+        self.collision_grid: CollisionGrid = None
+        self.planner: PathPlanner = None
+        self.ghost_ai: GhostAI = None
+        self.rng: random.Random = None  # свой у каждой партии, его состояние входит в снимок
         self.lives = 3
         self.score = 0
         self.score_cookie_pickup = 10
@@ -91,35 +482,73 @@ class Render:
         self.score_powerup_pickup = 50
         self.powerup_active = False  # powerup, special ability
         self.current_mode = GhostMode.SCATTER
-        self.mode_switch_event = pygame.USEREVENT + 1
-        self.powerup_end_event = pygame.USEREVENT + 2
-        self.pakupaku_event = pygame.USEREVENT + 3
-        self.modes = [
-            (7, 99999),
-            (7, 100),
-            (5, 100),
-            (5, 999999)
-        ]
+        self.modes = list(MODE_SCHEDULE)
         self.current_phase = 0
+        # таймеры в тиках вместо pygame.time.set_timer
+        self.powerup_ticks = POWERUP_SECONDS * tick_rate
+        self.pakupaku_ticks = max(tick_rate // 5, 1)  # open close mouth every 200ms
+        self.mode_switch_tick = None
+        self.powerup_end_tick = None
+
+    def start(self):
+        self.started = True
+        self.switch_mode()
 
-    def tick(self, fps: int):
-        black = (0, 0, 0)
+    def step(self, action: Movement = None):
+        if not self.started:
+            self.start()
+        if self.planner is not None:
+            self.planner.collect(self.ticks)
+        if self.ghost_ai is not None:
+            self.ghost_ai.update(self)
+        self.last_action = action
+        if action is not None and self.pacman is not None:
+            self.pacman.set_dir(action)
 
-        self.switch_mode()
-        pygame.time.set_timer(self.pakupaku_event, 200)  # open close mouth
-        while not self.done:
-            for game_object in self.game_objects:
-                game_object.tick()
-                game_object.draw()
+        for movable in list(self.movables):
+            movable.tick()
+        if self.planner is not None:
+            self.planner.flush(self.ticks)
 
-            self.display_text(f"[Score: {self.score}]  [Lives: {self.lives}]")
+        self.ticks += 1
+        self.handle_timers()
+        for observer in self.observers:
+            observer.on_step(self)
+        return self.is_over()
 
-            if self.pacman is None: self.display_text("YOU DIED", (self.width / 2 - 256, self.height / 2 - 256), 100)
-            if self.get_won(): self.display_text("YOU WON", (self.width / 2 - 256, self.height / 2 - 256), 100)
-            pygame.display.flip()
-            self.clock.tick(fps)
-            self.screen.fill(black)
-            self.handle_events()
+    def handle_timers(self):
+        if self.ticks == self.mode_switch_tick:
+            self.switch_mode()
+
+        if self.ticks == self.powerup_end_tick:
+            self.powerup_active = False
+            self.powerup_end_tick = None
+
+        if self.pacman is not None and self.ticks % self.pakupaku_ticks == 0:
+            self.pacman.mouth_open = not self.pacman.mouth_open
+
+    def is_over(self):
+        return self.pacman is None or self.won
+
+    def seed(self, seed):
+        self.rng.seed(seed)
+
+    def snapshot(self) -> Snapshot:
+        return Snapshot(self)
+
+    def state_hash(self) -> int:
+        return self.snapshot().digest()
+
+    def restore(self, snapshot: Snapshot):
+        snapshot.apply(self)
+        for observer in self.observers:
+            observer.on_reset(self)
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
 
     def switch_mode(self):
         phase_timing = self.modes[self.current_phase]
@@ -133,25 +562,64 @@ class Render:
             self.set_current_mode(GhostMode.CHASE)
 
         used_timing = scatter_time if self.current_mode == GhostMode.SCATTER else chase_time
-        pygame.time.set_timer(self.mode_switch_event, used_timing * 1000)
+        self.mode_switch_tick = self.ticks + used_timing * self.tick_rate
 
     def start_powerup_timeout(self):
-        pygame.time.set_timer(self.powerup_end_event, 10000)  # 10s
+        self.powerup_end_tick = self.ticks + self.powerup_ticks
 
     def add_game_obj(self, obj: GameObj):
         self.game_objects.append(obj)
+        if isinstance(obj, MovableObj):
+            self.movables.append(obj)
+            self.spatial_hash.insert(obj)
+        for observer in self.observers:
+            observer.on_add(obj)
+
+    def remove_game_obj(self, obj: GameObj):
+        self.game_objects.remove(obj)
+        if obj in self.walls:
+            self.walls.remove(obj)
+        if obj in self.movables:
+            self.movables.remove(obj)
+            self.spatial_hash.remove(obj)
+        for observer in self.observers:
+            observer.on_remove(obj)
 
     def add_cookie(self, obj: GameObj):
-        self.game_objects.append(obj)
-        self.cookies.append(obj)
+        self.pellets.add_cookie(obj)
+        for observer in self.observers:
+            observer.on_add(obj)
+
+    def load_pellets(self, cookies, powerups):
+        self.pellets.load(cookies, powerups)
+        for observer in self.observers:
+            observer.on_reset(self)
+
+    def remove_pellet(self, obj: GameObj):
+        cell = self.pellets.cell_of(obj)
+        if isinstance(obj, Powerup):
+            self.eat_powerup(cell)
+        else:
+            self.eat_cookie(cell)
+
+    def eat_cookie(self, cell):
+        if self.pellets.eat_cookie(*cell):
+            for observer in self.observers:
+                observer.on_pellet_eaten(cell, False)
+
+    def eat_powerup(self, cell):
+        if self.pellets.eat_powerup(*cell):
+            for observer in self.observers:
+                observer.on_pellet_eaten(cell, True)
 
     def add_ghost(self, obj: GameObj):
-        self.game_objects.append(obj)
+        self.add_game_obj(obj)
         self.ghosts.append(obj)
 
     def add_powerup(self, obj: GameObj):
-        self.game_objects.append(obj)
-        self.powerups.append(obj)
+        self.pellets.add_powerup(obj)
+        for observer in self.observers:
+            observer.on_add(obj)
 
     def active_powerup(self):
         self.powerup_active = True
@@ -178,20 +646,15 @@ class Render:
 
     def end_game(self):
         if self.pacman in self.game_objects:
-            self.game_objects.remove(self.pacman)
+            self.remove_game_obj(self.pacman)
         self.pacman = None
 
     def kill_pacman(self):
         self.lives -= 1
-        self.pacman.set_position(32, 32)
+        self.pacman.set_position(*self.pacman_spawn)
         self.pacman.set_dir(Movement.NONE)
         if self.lives == 0: self.end_game()
 
-    def display_text(self, text, in_position=(32, 0), in_size=30):
-        font = pygame.font.SysFont('Arial', in_size)
-        text_surface = font.render(text, False, (255, 255, 255))
-        self.screen.blit(text_surface, in_position)
-
     def is_powerup_active(self):
         return self.powerup_active
 
@@ -200,16 +663,33 @@ class Render:
         self.walls.append(obj)
 
     def get_walls(self):
-        return self.walls
+        if self.collision_grid is None:
+            return self.walls
+        # объекты стен создаются только по запросу, сама сетка их не хранит
+        size = self.collision_grid.tile_size
+        grid_walls = [Wall(self, col, row, size) for row, col in np.argwhere(self.collision_grid.walls)]
+        return self.walls + grid_walls
+
+    def set_collision_grid(self, grid: CollisionGrid):
+        self.collision_grid = grid
+
+    def get_collision_grid(self):
+        return self.collision_grid
 
     def get_cookies(self):
-        return self.cookies
+        return [Point(self, *self.pellets.center_of(*cell)) for cell in self.pellets.cookie_cells()]
 
     def get_ghosts(self):
         return self.ghosts
 
     def get_powerups(self):
-        return self.powerups
+        return [Powerup(self, *self.pellets.center_of(*cell)) for cell in self.pellets.powerup_cells()]
+
+    def get_pellets(self):
+        return self.pellets
+
+    def get_spatial_hash(self):
+        return self.spatial_hash
 
     def get_game_objects(self):
         return self.game_objects
@@ -218,35 +698,183 @@ class Render:
         self.add_game_obj(pacman)
         self.pacman = pacman
 
+
+class Render(SimulationObserver):
+    def __init__(self, simulation: Simulation, dirty_rendering: bool = False):
+        pygame.init()
+        self.simulation = simulation
+        self.width = simulation.width
+        self.height = simulation.height
+        self.screen = pygame.display.set_mode((self.width, self.height))
+        pygame.display.set_caption('Pacman')
+        self.clock = pygame.time.Clock()
+        self.done = False
+        self.dirty_rendering = dirty_rendering
+        self.background = None  # стены и очки, нарисованные один раз
+        self.dirty_rects = []
+        self.drawn_rects = []
+        self.profiler = None  # подключается через profiler.FrameProfiler.attach
+        simulation.screen = self.screen
+        simulation.add_observer(self)
+        self.preload_assets()
+
+    def preload_assets(self):
+        # спрайты грузятся одним атласом до первого кадра, а не по ходу игры
+        sizes = {}
+        for movable in self.simulation.movables:
+            sizes.setdefault(movable._size, []).extend(movable.sprite_paths())
+        for size, paths in sizes.items():
+            assets.load_atlas(paths, size)
+
+    def tick(self, fps: int):
+        while not self.done:
+            profiler = self.profiler
+            if profiler is not None:
+                profiler.begin_frame()
+            action = self.handle_events()
+            self.simulation.step(action)
+            self.draw_frame()
+            if profiler is not None:
+                profiler.end_frame()
+            self.clock.tick(fps)
+
+    def draw_frame(self):
+        if self.dirty_rendering:
+            self.draw_dirty_frame()
+        else:
+            self.draw_full_frame()
+
+    def on_add(self, obj: GameObj):
+        if not isinstance(obj, MovableObj):
+            self.background = None
+
+    def on_reset(self, simulation: Simulation):
+        self.background = None
+
+    def on_remove(self, obj: GameObj):
+        if isinstance(obj, MovableObj) or self.background is None:
+            return
+        if obj._circle:
+            # круг рисуется от центра, прямоугольник - от левого верхнего угла
+            self.erase_from_background(pygame.Rect(obj.x - obj._size, obj.y - obj._size,
+                                                   obj._size * 2 + 1, obj._size * 2 + 1))
+        else:
+            self.erase_from_background(obj.get_shape().copy())
+
+    def on_pellet_eaten(self, cell, powerup: bool):
+        if self.background is None:
+            return
+        pellets = self.simulation.get_pellets()
+        col, row = cell
+        if not powerup and pellets.powerups[row, col]:
+            # очко под энерджайзером не видно
+            return
+        # съеденное очко стираем только с фона
+        center_x, center_y = pellets.center_of(*cell)
+        radius = Powerup.size
+        self.erase_from_background(pygame.Rect(center_x - radius, center_y - radius, radius * 2 + 1, radius * 2 + 1))
+        if pellets.cookies[row, col]:
+            pygame.draw.circle(self.background, Point.color, (center_x, center_y), Point.size)
+
+    def erase_from_background(self, rect):
+        self.background.fill((0, 0, 0), rect)
+        self.dirty_rects.append(rect)
+
+    def draw_static(self):
+        simulation = self.simulation
+        grid = simulation.get_collision_grid()
+        if grid is not None:
+            size = grid.tile_size
+            for row, col in np.argwhere(grid.walls):
+                pygame.draw.rect(self.screen, Wall.color, (col * size, row * size, size, size), border_radius=1)
+        for game_object in simulation.get_game_objects():
+            if not isinstance(game_object, MovableObj):
+                game_object.draw()
+
+        pellets = simulation.get_pellets()
+        for cell in pellets.cookie_cells():
+            pygame.draw.circle(self.screen, Point.color, pellets.center_of(*cell), Point.size)
+        for cell in pellets.powerup_cells():
+            pygame.draw.circle(self.screen, Powerup.color, pellets.center_of(*cell), Powerup.size)
+
+    def draw_full_frame(self):
+        black = (0, 0, 0)
+        self.draw_static()
+        for movable in self.simulation.movables:
+            movable.draw()
+
+        self.draw_hud()
+        self.present()
+        self.screen.fill(black)
+
+    def draw_dirty_frame(self):
+        if self.background is None:
+            self.build_background()
+            self.screen.blit(self.background, (0, 0))
+            self.present()
+
+        # стираем спрайты прошлого кадра и съеденные очки
+        restored = self.dirty_rects + self.drawn_rects
+        for rect in restored:
+            self.screen.blit(self.background, rect, rect)
+        self.dirty_rects = []
+        self.drawn_rects = []
+
+        for movable in self.simulation.movables:
+            movable.draw()
+            self.drawn_rects.append(movable.get_shape().copy())
+
+        self.drawn_rects.extend(self.draw_hud())
+        self.present(restored + self.drawn_rects)
+
+    def present(self, rects=None):
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+    def draw_hud(self):
+        simulation = self.simulation
+        rects = [self.display_text(f"[Score: {simulation.score}]  [Lives: {simulation.lives}]")]
+        if simulation.pacman is None:
+            rects.append(self.display_text("YOU DIED", (self.width / 2 - 256, self.height / 2 - 256), 100))
+        if simulation.get_won():
+            rects.append(self.display_text("YOU WON", (self.width / 2 - 256, self.height / 2 - 256), 100))
+        if self.profiler is not None and self.profiler.overlay:
+            rects.append(self.display_text(self.profiler.overlay_text(), (32, 32), 20))
+        return rects
+
+    def build_background(self):
+        black = (0, 0, 0)
+        self.screen.fill(black)
+        self.draw_static()
+        self.background = self.screen.copy()
+
+    def display_text(self, text, in_position=(32, 0), in_size=30):
+        text_surface = assets.text(text, in_size)
+        return self.screen.blit(text_surface, in_position)
+
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.done = True
 
-            if event.type == self.mode_switch_event:
-                self.switch_mode()
-
-            if event.type == self.powerup_end_event:
-                self.powerup_active = False
-
-            if event.type == self.pakupaku_event:
-                if self.pacman is None: break
-                self.pacman.mouth_open = not self.pacman.mouth_open
-
         pressed = pygame.key.get_pressed()
-        if self.pacman is None: return
         if pressed[pygame.K_UP]:
-            self.pacman.set_dir(Movement.UP)
+            return Movement.UP
         elif pressed[pygame.K_LEFT]:
-            self.pacman.set_dir(Movement.LEFT)
+            return Movement.LEFT
         elif pressed[pygame.K_DOWN]:
-            self.pacman.set_dir(Movement.DOWN)
+            return Movement.DOWN
         elif pressed[pygame.K_RIGHT]:
-            self.pacman.set_dir(Movement.RIGHT)
-
+            return Movement.RIGHT
+        return None
 
 
 class MovableObj(GameObj):
+    __slots__ = ('current_direction', 'direction_buff', 'last_direction', 'location_queue',
+                 'next_target', 'sprite_path', 'image')
+
     def __init__(self, surface, x, y, size: int, color=(255, 0, 0), is_circle: bool = False):
         super().__init__(surface, x, y, size, color, is_circle)
         self.current_direction = Movement.NONE
@@ -254,16 +882,30 @@ class MovableObj(GameObj):
         self.last_direction = Movement.NONE
         self.location_queue = []
         self.next_target = None
-        self.image = pygame.image.load('images/ghost.png')
+        self.sprite_path = 'images/ghost.png'
+        self.image = None
 
     def get_next_location(self):
         return None if len(self.location_queue) == 0 else self.location_queue.pop(0)
 
+    def set_position(self, x, y):
+        self.x = x
+        self.y = y
+        self.renderer.get_spatial_hash().move(self)
+
     def set_dir(self, direction):
         self.current_direction = direction
         self.direction_buff = direction
 
     def collides_with_wall(self, position):
+        grid = self.renderer.get_collision_grid()
+        if grid is not None:
+            if grid.collides(position[0], position[1], self._size, self._size):
+                return True
+            # стены, добавленные через add_wall, в общую сетку уровня не попадают
+            return any(rects_overlap(position[0], position[1], self._size, self._size,
+                                     wall.x, wall.y, wall._size, wall._size) for wall in self.renderer.walls)
+
         collision_rect = pygame.Rect(position[0], position[1], self._size, self._size)
         collides = False
         walls = self.renderer.get_walls()
@@ -296,27 +938,34 @@ class MovableObj(GameObj):
     def reached_target(self):
         pass
 
+    def sprite_paths(self):
+        return (self.sprite_path,)
+
+    def get_sprite(self):
+        return assets.sprite(self.sprite_path, self._size)
+
     def draw(self):
-        self.image = pygame.transform.scale(self.image, (32, 32))
+        self.image = self.get_sprite()
         self.surface.blit(self.image, self.get_shape())
 
 
 class Pacman(MovableObj):
+    __slots__ = ('last_notcolliding_position', 'open_sprite_path', 'closed_sprite_path', 'mouth_open')
+
     def __init__(self, surface, x, y, size: int):
         super().__init__(surface, x, y, size, (255, 255, 0), False)
         self.last_notcolliding_position = (0, 0)
-        self.open = pygame.image.load("images/paku.png")
-        self.closed = pygame.image.load("images/man.png")
-        self.image = self.open
+        self.open_sprite_path = "images/paku.png"
+        self.closed_sprite_path = "images/man.png"
         self.mouth_open = True
 
     def tick(self):
         # Телепорт
         if self.x < 0:
-            self.x = self.renderer.width
+            self.set_position(self.renderer.width, self.y)
 
         if self.x > self.renderer.width:
-            self.x = 0
+            self.set_position(0, self.y)
 
         self.last_notcolliding_position = self.get_position()
 
@@ -344,58 +993,51 @@ class Pacman(MovableObj):
             self.current_direction = self.last_direction
 
     def handle_cookie_and_powerup_pickup(self):
-        collision_rect = pygame.Rect(self.x, self.y, self._size, self._size)
-        cookies = self.renderer.get_cookies()
-        powerups = self.renderer.get_powerups()
-        game_objects = self.renderer.get_game_objects()
-        cookie_to_remove = None
-        for cookie in cookies:
-            collides = collision_rect.colliderect(cookie.get_shape())
-            if collides and cookie in game_objects:
-                game_objects.remove(cookie)
-                self.renderer.add_score(Score.COOKIE)
-                cookie_to_remove = cookie
-
-        if cookie_to_remove is not None:
-            cookies.remove(cookie_to_remove)
-
-        if len(self.renderer.get_cookies()) == 0:
+        pellets = self.renderer.get_pellets()
+        for cell in pellets.cookies_under(self.x, self.y, self._size, self._size):
+            self.renderer.eat_cookie(cell)
+            self.renderer.add_score(Score.COOKIE)
+
+        if pellets.cookies_left() == 0:
             self.renderer.set_won()
 
-        for powerup in powerups:
-            collides = collision_rect.colliderect(powerup.get_shape())
-            if collides and powerup in game_objects:
-                if not self.renderer.is_powerup_active():
-                    game_objects.remove(powerup)
-                    self.renderer.add_score(Score.POWERUP)
-                    self.renderer.active_powerup()
+        for cell in pellets.powerups_under(self.x, self.y, self._size, self._size):
+            if not self.renderer.is_powerup_active():
+                self.renderer.eat_powerup(cell)
+                self.renderer.add_score(Score.POWERUP)
+                self.renderer.active_powerup()
 
     def handle_ghosts(self):
-        collision_rect = pygame.Rect(self.x, self.y, self._size, self._size)
-        ghosts = self.renderer.get_ghosts()
-        game_objects = self.renderer.get_game_objects()
-        for ghost in ghosts:
-            collides = collision_rect.colliderect(ghost.get_shape())
-            if collides and ghost in game_objects:
-                if self.renderer.is_powerup_active():
-                    game_objects.remove(ghost)
-                    self.renderer.add_score(Score.GHOST)
-                else:
-                    if not self.renderer.get_won():
-                        self.renderer.kill_pacman()
+        spatial_hash = self.renderer.get_spatial_hash()
+        for ghost in spatial_hash.query(self.x, self.y, self._size, self._size):
+            if not isinstance(ghost, Ghost) or ghost not in spatial_hash:
+                continue
+            if self.renderer.is_powerup_active():
+                self.renderer.remove_game_obj(ghost)
+                self.renderer.add_score(Score.GHOST)
+            else:
+                if not self.renderer.get_won():
+                    self.renderer.kill_pacman()
+                    if self.renderer.pacman is None: break
 
-    def draw(self):
-        self.image = self.open if self.mouth_open else self.closed
-        self.image = pygame.transform.rotate(self.image, self.current_direction.value)
-        super(Pacman, self).draw()
+    def sprite_paths(self):
+        return self.open_sprite_path, self.closed_sprite_path
+
+    def get_sprite(self):
+        path = self.open_sprite_path if self.mouth_open else self.closed_sprite_path
+        return assets.sprite(path, self._size, self.current_direction)
 
 
 class Ghost(MovableObj):
+    __slots__ = ('game_controller', 'normal_sprite_path', 'fright_sprite_path')
+    # сдвиг клетки (col, row) для направления движения
+    headings = {Movement.UP: (0, -1), Movement.DOWN: (0, 1), Movement.LEFT: (-1, 0), Movement.RIGHT: (1, 0)}
+
     def __init__(self, in_surface, x, y, size: int, game_controller, sprite_path="images/ghost_fright.png"):
         super().__init__(in_surface, x, y, size)
         self.game_controller = game_controller
-        self.normal_sprite = pygame.image.load(sprite_path)
-        self.fright_sprite = pygame.image.load("images/ghost_fright.png")
+        self.normal_sprite_path = sprite_path
+        self.fright_sprite_path = "images/ghost_fright.png"
 
     def reached_target(self):
         if (self.x, self.y) == self.next_target:
@@ -407,13 +1049,14 @@ class Ghost(MovableObj):
             self.location_queue.append(item)
         self.next_target = self.get_next_location()
 
+    def add_path(self, path):
+        self.location_queue.extend(path)
+        if self.next_target is None:
+            self.next_target = self.get_next_location()
+
     def calculate_direction_to_next_target(self) -> Movement:
         if self.next_target is None:
-            if self.renderer.get_current_mode() == GhostMode.CHASE and not self.renderer.is_powerup_active():
-                self.path_to_player(self)
-            else:
-                self.game_controller.request_random_path(self)
-            return Movement.NONE
+            return self.request_path()
 
         diff_x = self.next_target[0] - self.x
         diff_y = self.next_target[1] - self.y
@@ -421,13 +1064,62 @@ class Ghost(MovableObj):
             return Movement.DOWN if diff_y > 0 else Movement.UP
         if diff_y == 0:
             return Movement.LEFT if diff_x < 0 else Movement.RIGHT
+        return self.request_path()
 
-        if self.renderer.get_current_mode() == GhostMode.CHASE and not self.renderer.is_powerup_active():
-            self.path_to_player(self)
+    def request_path(self) -> Movement:
+        if self.game_controller.ghost_ai is not None:
+            # цель выберет GhostAI в начале следующего тика
+            return Movement.NONE
+        chasing = self.renderer.get_current_mode() == GhostMode.CHASE and not self.renderer.is_powerup_active()
+        if chasing and self.game_controller.chase_field is not None:
+            return self.follow_chase_field()
+        planner = self.renderer.planner
+        if planner is None:
+            if chasing:
+                self.path_to_player(self)
+            else:
+                self.game_controller.request_random_path(self)
+            return Movement.NONE
+        if self in planner.pending:
+            return Movement.NONE
+
+        if chasing:
+            target = screen_to_maze(self.renderer.get_hero_position())
         else:
-            self.game_controller.request_random_path(self)
+            target = self.game_controller.random_space(self.renderer.rng)
+        start = screen_to_maze(self.get_position())
+        self.location_queue.clear()
+        self.next_target = None
+        # пока путь считается, едем дальше по прямой, если впереди не стена
+        ahead = self.cell_ahead(start)
+        if ahead is not None and maze_to_screen(start) == self.get_position():
+            self.next_target = maze_to_screen(ahead)
+            planner.request(self, ahead, target)
+            return self.current_direction
+        planner.request(self, start, target)
         return Movement.NONE
 
+    def follow_chase_field(self) -> Movement:
+        start = screen_to_maze(self.get_position())
+        if maze_to_screen(start) != self.get_position():
+            self.path_to_player(self)
+            return Movement.NONE
+        target = screen_to_maze(self.renderer.get_hero_position())
+        step = self.game_controller.chase_field.next_cell(start, target)
+        self.location_queue.clear()
+        self.next_target = None
+        if step is None:
+            return Movement.NONE
+        self.next_target = maze_to_screen(step)
+        return self.calculate_direction_to_next_target()
+
+    def cell_ahead(self, cell):
+        delta = self.headings.get(self.current_direction)
+        if delta is None:
+            return None
+        col, row = cell[0] + delta[0], cell[1] + delta[1]
+        return (col, row) if self.game_controller.p.contains(row, col) else None
+
     def path_to_player(self, in_ghost):
         player_position = screen_to_maze(in_ghost.renderer.get_hero_position())
         maze_coord = screen_to_maze(in_ghost.get_position())
@@ -447,19 +1139,30 @@ class Ghost(MovableObj):
         elif direction == Movement.RIGHT:
             self.set_position(self.x + 1, self.y)
 
-    def draw(self):
-        self.image = self.fright_sprite if self.renderer.is_powerup_active() else self.normal_sprite
-        super(Ghost, self).draw()
+    def sprite_paths(self):
+        return self.normal_sprite_path, self.fright_sprite_path
+
+    def get_sprite(self):
+        path = self.fright_sprite_path if self.renderer.is_powerup_active() else self.normal_sprite_path
+        return assets.sprite(path, self._size)
 
 
 class Point(GameObj):
+    __slots__ = ()
+    size = 4
+    color = (255, 255, 0)
+
     def __init__(self, surface, x, y):
-        super().__init__(surface, x, y, 4, (255, 255, 0), True)
+        super().__init__(surface, x, y, self.size, self.color, True)
 
 
 class Powerup(GameObj):
+    __slots__ = ()
+    size = 8
+    color = (255, 255, 255)
+
     def __init__(self, surface, x, y):
-        super().__init__(surface, x, y, 8, (255, 255, 255), True)
+        super().__init__(surface, x, y, self.size, self.color, True)
 
 
 class PathFinder:
@@ -472,8 +1175,435 @@ class PathFinder:
         return [(sub[1], sub[0]) for sub in res]
 
 
+class PathOracle:
+    # соседи клетки: вверх, вниз, влево, вправо (row, col)
+    neighbours = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+    def __init__(self, arr, all_pairs_limit: int = 4096, cache_bytes: int = 64 * 2 ** 20, fields=None):
+        self.passable = np.array(arr, dtype=np.bool_)
+        self.height, self.width = self.passable.shape
+        self.cells = np.argwhere(self.passable)
+        self.cell_index = np.full(self.passable.shape, -1, dtype=np.int32)
+        self.cell_index[self.cells[:, 0], self.cells[:, 1]] = np.arange(len(self.cells), dtype=np.int32)
+        self.maze_hash = maze_hash(self.passable)
+        # сколько полей по запросу держать в LRU, исходя из бюджета памяти
+        self.cache_size = max(cache_bytes // (self.passable.size * 4), 4)
+        self.field_cache = {}
+        self.cost = None
+        # все пары храним только для небольших лабиринтов, иначе считаем поля по запросу;
+        # таблица строится при первом обращении к fields
+        self._fields = fields
+        self.all_pairs = fields is not None or len(self.cells) <= all_pairs_limit
+
+    @property
+    def fields(self):
+        if self._fields is None and self.all_pairs:
+            self._fields = self.build_fields(self.cells)
+        return self._fields
+
+    @classmethod
+    def cached(cls, arr, cache_dir, **kwargs):
+        passable = np.array(arr, dtype=np.bool_)
+        path = os.path.join(cache_dir, f"oracle-{maze_hash(passable)}.npy")
+        if os.path.exists(path):
+            return cls(passable, fields=np.load(path, mmap_mode='r'), **kwargs)
+        oracle = cls(passable, **kwargs)
+        if oracle.fields is not None:
+            oracle.save(path)
+        return oracle
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            np.save(file, self.fields)
+        os.replace(tmp_path, path)
+
+    def build_fields(self, targets, chunk: int = 256):
+        # BFS сразу от многих целей: одна волна numpy на шаг для всех полей
+        fields = np.full((len(targets), self.height, self.width), -1, dtype=np.int16)
+        for start in range(0, len(targets), chunk):
+            part = targets[start:start + chunk]
+            layer = np.arange(len(part))
+            dist = fields[start:start + len(part)]
+            frontier = np.zeros(dist.shape, dtype=np.bool_)
+            frontier[layer, part[:, 0], part[:, 1]] = True
+            dist[frontier] = 0
+            step = 0
+            while frontier.any():
+                step += 1
+                grown = np.zeros_like(frontier)
+                grown[:, 1:, :] |= frontier[:, :-1, :]
+                grown[:, :-1, :] |= frontier[:, 1:, :]
+                grown[:, :, 1:] |= frontier[:, :, :-1]
+                grown[:, :, :-1] |= frontier[:, :, 1:]
+                frontier = grown & self.passable & (dist < 0)
+                dist[frontier] = step
+        return fields
+
+    def build_field(self, index: int):
+        # для больших лабиринтов волна numpy слишком медленная, считаем дейкстрой tcod
+        if self.cost is None:
+            self.cost = self.passable.astype(np.int8)
+        row, col = self.cells[index]
+        field = tcod.path.maxarray(self.passable.shape, dtype=np.int32)
+        field[row, col] = 0
+        tcod.path.dijkstra2d(field, self.cost, 1, None, out=field)
+        field[field == np.iinfo(np.int32).max] = -1
+        return field
+
+    def field(self, row: int, col: int):
+        index = self.cell_index[row, col]
+        if index < 0:
+            return None
+        if self.fields is not None:
+            return self.fields[index]
+        field = self.field_cache.pop(index, None)
+        if field is None:
+            field = self.build_field(index)
+            if len(self.field_cache) >= self.cache_size:
+                self.field_cache.pop(next(iter(self.field_cache)))
+        self.field_cache[index] = field
+        return field
+
+    def contains(self, row: int, col: int) -> bool:
+        return 0 <= row < self.height and 0 <= col < self.width and self.cell_index[row, col] >= 0
+
+    def distance(self, from_row: int, from_col: int, to_row: int, to_col: int) -> int:
+        if not self.contains(from_row, from_col) or not self.contains(to_row, to_col):
+            return -1
+        return int(self.field(to_row, to_col)[from_row, from_col])
+
+    def next_step(self, from_row: int, from_col: int, to_row: int, to_col: int, field=None):
+        if not self.contains(from_row, from_col) or not self.contains(to_row, to_col):
+            return None
+        if field is None:
+            field = self.field(to_row, to_col)
+        return self.step_down(field, from_row, from_col)
+
+    def step_down(self, field, row: int, col: int):
+        current = field[row, col]
+        if current <= 0:
+            return None
+        for d_row, d_col in self.neighbours:
+            next_row = row + d_row
+            next_col = col + d_col
+            if 0 <= next_row < self.height and 0 <= next_col < self.width \
+                    and field[next_row, next_col] == current - 1:
+                return next_row, next_col
+        return None
+
+    def next_steps(self, from_rows, from_cols, to_rows, to_cols):
+        # векторный next_step для массивов клеток; -1 там, где шага нет
+        from_rows = np.asarray(from_rows)
+        from_cols = np.asarray(from_cols)
+        to_rows = np.asarray(to_rows)
+        to_cols = np.asarray(to_cols)
+        next_rows = np.full(from_rows.shape, -1, dtype=np.int32)
+        next_cols = np.full(from_rows.shape, -1, dtype=np.int32)
+        valid = self.contains_many(from_rows, from_cols) & self.contains_many(to_rows, to_cols)
+        if not valid.any():
+            return next_rows, next_cols
+
+        targets = self.cell_index[to_rows[valid], to_cols[valid]]
+        rows = from_rows[valid]
+        cols = from_cols[valid]
+        if self.fields is not None:
+            fields = self.fields
+            found_rows, found_cols = self.descend(lambda r, c: fields[targets, r, c], rows, cols)
+        else:
+            # поля считаются по одному на цель, без общего стека в памяти
+            found_rows = np.full(rows.shape, -1, dtype=np.int32)
+            found_cols = np.full(rows.shape, -1, dtype=np.int32)
+            for index in np.unique(targets):
+                group = targets == index
+                field = self.field(*self.cells[index])
+                found_rows[group], found_cols[group] = self.descend(lambda r, c: field[r, c],
+                                                                    rows[group], cols[group])
+
+        next_rows[valid] = found_rows
+        next_cols[valid] = found_cols
+        return next_rows, next_cols
+
+    def descend(self, lookup, rows, cols):
+        current = lookup(rows, cols)
+        found_rows = np.full(rows.shape, -1, dtype=np.int32)
+        found_cols = np.full(rows.shape, -1, dtype=np.int32)
+        pending = current > 0
+        for d_row, d_col in self.neighbours:
+            candidate_rows = rows + d_row
+            candidate_cols = cols + d_col
+            inside = (candidate_rows >= 0) & (candidate_rows < self.height) \
+                & (candidate_cols >= 0) & (candidate_cols < self.width)
+            distance = lookup(np.clip(candidate_rows, 0, self.height - 1),
+                              np.clip(candidate_cols, 0, self.width - 1))
+            hit = pending & inside & (distance == current - 1)
+            found_rows[hit] = candidate_rows[hit]
+            found_cols[hit] = candidate_cols[hit]
+            pending &= ~hit
+        return found_rows, found_cols
+
+    def contains_many(self, rows, cols):
+        inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        result = np.zeros(inside.shape, dtype=np.bool_)
+        result[inside] = self.cell_index[rows[inside], cols[inside]] >= 0
+        return result
+
+    def get_path(self, from_x, from_y, to_x, to_y) -> object:
+        # те же аргументы, что у PathFinder: (строка, столбец); ответ в (x, y)
+        if not self.contains(from_x, from_y) or not self.contains(to_x, to_y):
+            return []
+        return self.walk(self.field(to_x, to_y), from_x, from_y)
+
+    def walk(self, field, row: int, col: int):
+        path = []
+        cell = self.step_down(field, row, col)
+        while cell is not None:
+            path.append((cell[1], cell[0]))
+            cell = self.step_down(field, cell[0], cell[1])
+        return path
+
+
+class ChaseField:
+    # одно поле направлений к клетке Пакмана на всех призраков, пересчитывается только при смене клетки
+    def __init__(self, oracle: PathOracle):
+        self.oracle = oracle
+        self.target = None
+        self.next_rows = None
+        self.next_cols = None
+        self.rebuilds = 0
+
+    def update(self, target):
+        if target == self.target:
+            return
+        self.target = target
+        self.next_rows = None
+        self.next_cols = None
+        oracle = self.oracle
+        col, row = target
+        if not oracle.contains(row, col):
+            return
+        field = oracle.field(row, col)
+        rows = oracle.cells[:, 0]
+        cols = oracle.cells[:, 1]
+        found_rows, found_cols = oracle.descend(lambda r, c: field[r, c], rows, cols)
+        self.next_rows = np.full(oracle.passable.shape, -1, dtype=np.int32)
+        self.next_cols = np.full(oracle.passable.shape, -1, dtype=np.int32)
+        self.next_rows[rows, cols] = found_rows
+        self.next_cols[rows, cols] = found_cols
+        self.rebuilds += 1
+
+    def next_cell(self, cell, target):
+        # (col, row) следующей клетки к цели или None, если ее нет
+        self.update(target)
+        col, row = cell
+        if self.next_rows is None or not self.oracle.contains(row, col):
+            return None
+        next_row = self.next_rows[row, col]
+        if next_row < 0:
+            return None
+        return int(self.next_cols[row, col]), int(next_row)
+
+
+# характер призрака по индексу цвета в GameController.ghost_colors: красный, розовый, оранжевый, голубой
+CHASE, AMBUSH, SHY, FLANK = range(4)
+PERSONALITIES = (CHASE, AMBUSH, SHY, FLANK)
+
+
+class GhostAI:
+    # цели всех призраков считаются одним векторным проходом, шаг берется из общих полей расстояний
+    ambush_tiles = 4
+    flank_tiles = 2
+    shy_distance = 8
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.oracle: PathOracle = controller.p
+        passable = self.oracle.passable
+        self.height, self.width = passable.shape
+        self.nearest_rows, self.nearest_cols = self.nearest_passable(passable)
+        # углы для разбегания: правый верхний, левый верхний, левый нижний, правый нижний
+        corners = np.array([(self.width - 1, 0), (0, 0), (0, self.height - 1), (self.width - 1, self.height - 1)])
+        self.corners = self.snap(corners)
+        self.deltas = np.array([Ghost.headings.get(direction, (0, 0)) for direction in Movement], dtype=np.int32)
+        self.neighbours = np.array([(0, -1), (0, 1), (-1, 0), (1, 0)], dtype=np.int32)
+
+    def nearest_passable(self, passable):
+        # для каждой клетки ближайшая проходимая: волна от всех проходимых клеток сразу
+        rows, cols = np.indices(passable.shape)
+        nearest_rows = np.where(passable, rows, -1)
+        nearest_cols = np.where(passable, cols, -1)
+        while (nearest_rows < 0).any() and passable.any():
+            assigned = nearest_rows >= 0
+            for axis, shift in ((0, 1), (0, -1), (1, 1), (1, -1)):
+                source = np.roll(assigned, shift, axis=axis)
+                edge = [slice(None)] * 2
+                edge[axis] = 0 if shift > 0 else -1
+                source[tuple(edge)] = False
+                grow = source & (nearest_rows < 0)
+                nearest_rows[grow] = np.roll(nearest_rows, shift, axis=axis)[grow]
+                nearest_cols[grow] = np.roll(nearest_cols, shift, axis=axis)[grow]
+        return nearest_rows, nearest_cols
+
+    def snap(self, cells):
+        cols = np.clip(cells[..., 0], 0, self.width - 1)
+        rows = np.clip(cells[..., 1], 0, self.height - 1)
+        return np.stack([self.nearest_cols[rows, cols], self.nearest_rows[rows, cols]], axis=-1)
+
+    def update(self, simulation):
+        spatial_hash = simulation.get_spatial_hash()
+        roster = simulation.get_ghosts()
+        deciding = []
+        for index, ghost in enumerate(roster):
+            if ghost not in spatial_hash:
+                continue
+            target = ghost.next_target
+            if target is None or target == (ghost.x, ghost.y) or (target[0] != ghost.x and target[1] != ghost.y):
+                deciding.append(index)
+        if not deciding or simulation.pacman is None:
+            return
+
+        ghosts = [roster[index] for index in deciding]
+        positions = np.array([ghost.get_position() for ghost in ghosts], dtype=np.int32)
+        cells = positions // 32
+        aligned = (positions % 32 == 0).all(axis=1)
+        personality = np.array(deciding, dtype=np.int32) % len(PERSONALITIES)
+        directions = np.array([MOVEMENT_INDEX[ghost.current_direction] for ghost in ghosts], dtype=np.int32)
+
+        if simulation.is_powerup_active():
+            steps = self.wander(cells, directions, simulation.rng)
+        else:
+            targets = self.targets(simulation, roster, cells, personality)
+            steps = self.step_towards(cells, targets)
+            stuck = steps[:, 0] < 0
+            if stuck.any():
+                # призрак уже на своей цели: уходит в свой угол, а из угла блуждает
+                steps[stuck] = self.step_towards(cells[stuck], self.corners[personality[stuck]])
+                stuck = steps[:, 0] < 0
+                steps[stuck] = self.wander(cells[stuck], directions[stuck], simulation.rng)
+
+        for ghost, step, cell, is_aligned in zip(ghosts, steps.tolist(), cells.tolist(), aligned):
+            ghost.location_queue.clear()
+            if not is_aligned:
+                # сначала вернуться в свою клетку
+                ghost.next_target = maze_to_screen(cell)
+            elif step[0] >= 0:
+                ghost.next_target = maze_to_screen(step)
+            else:
+                ghost.next_target = None
+
+    def targets(self, simulation, roster, cells, personality):
+        if simulation.get_current_mode() == GhostMode.SCATTER:
+            return self.corners[personality]
+        pacman = simulation.pacman
+        pacman_cell = np.array(screen_to_maze(pacman.get_position()), dtype=np.int32)
+        heading = self.deltas[MOVEMENT_INDEX[pacman.current_direction]]
+        leader = pacman_cell
+        for index, ghost in enumerate(roster):
+            if index % len(PERSONALITIES) == CHASE and ghost in simulation.get_spatial_hash():
+                leader = np.array(screen_to_maze(ghost.get_position()), dtype=np.int32)
+                break
+
+        candidates = np.empty((len(PERSONALITIES), 2), dtype=np.int32)
+        candidates[CHASE] = pacman_cell
+        candidates[AMBUSH] = pacman_cell + heading * self.ambush_tiles
+        candidates[SHY] = pacman_cell
+        candidates[FLANK] = 2 * (pacman_cell + heading * self.flank_tiles) - leader
+        targets = self.snap(candidates)[personality]
+        # стеснительный гонится, только пока далеко, а вблизи уходит в свой угол
+        distance = np.hypot(*(cells - pacman_cell).T)
+        shy = (personality == SHY) & (distance <= self.shy_distance)
+        targets[shy] = self.corners[SHY]
+        return targets
+
+    def step_towards(self, cells, targets):
+        next_rows, next_cols = self.oracle.next_steps(cells[:, 1], cells[:, 0], targets[:, 1], targets[:, 0])
+        return np.stack([next_cols, next_rows], axis=1)
+
+    def wander(self, cells, directions, rng: random.Random):
+        # испуганный призрак на каждой клетке выбирает случайный проход, не разворачиваясь без нужды
+        candidates = cells[:, None, :] + self.neighbours[None, :, :]
+        cols = candidates[..., 0]
+        rows = candidates[..., 1]
+        valid = self.oracle.contains_many(rows, cols)
+        reverse = (self.neighbours[None, :, :] == -self.deltas[directions][:, None, :]).all(axis=2)
+        forward = valid & ~reverse
+        valid = np.where(forward.any(axis=1)[:, None], forward, valid)
+        noise = np.random.default_rng(rng.getrandbits(64)).random(valid.shape)
+        choice = np.argmax(np.where(valid, noise, -1), axis=1)
+        steps = candidates[np.arange(len(cells)), choice]
+        steps[~valid.any(axis=1)] = -1
+        return steps
+
+
+class PathPlanner:
+    # пути призраков считаются в пуле потоков; запросы одного тика к одной клетке решаются одним полем,
+    # а ответы раздаются в начале следующего тика, поэтому игра остается детерминированной.
+    # Планировщик свой у каждой партии, общий у партий одного контроллера только пул потоков
+    def __init__(self, oracle: PathOracle, executor: ThreadPoolExecutor):
+        self.oracle = oracle
+        self.executor = executor
+        self.requests = {}  # цель (col, row) -> [(ghost, старт (col, row))]
+        self.jobs = []
+        self.pending = set()
+        # растет при каждом restore: ответы на запросы из другой ветки партии отбрасываются
+        self.generation = 0
+
+    def request(self, ghost, start, target):
+        self.pending.add(ghost)
+        self.requests.setdefault(target, []).append((ghost, start))
+
+    def flush(self, tick: int):
+        for target, waiting in self.requests.items():
+            future = self.executor.submit(self.solve, target, [start for _, start in waiting])
+            self.jobs.append((self.generation, [ghost for ghost, _ in waiting], future))
+        self.requests = {}
+
+    def solve(self, target, starts):
+        oracle = self.oracle
+        col, row = target
+        if not oracle.contains(row, col):
+            return [[] for _ in starts]
+        # кеш полей общий, поэтому в потоке поле строится в обход него
+        index = oracle.cell_index[row, col]
+        field = oracle.fields[index] if oracle.fields is not None else oracle.build_field(index)
+        return [oracle.walk(field, start_row, start_col) if oracle.contains(start_row, start_col) else []
+                for start_col, start_row in starts]
+
+    def collect(self, tick: int):
+        for generation, ghosts, future in self.jobs:
+            if generation != self.generation:
+                continue
+            paths = future.result()
+            for ghost, path in zip(ghosts, paths):
+                self.pending.discard(ghost)
+                ghost.add_path([maze_to_screen(cell) for cell in path])
+        self.jobs = []
+
+    def resolve(self):
+        # ответы текущей ветки для снимка: дожидаемся их, чтобы восстановленная партия получила те же пути
+        return tuple((tuple(ghosts), tuple(tuple(path) for path in future.result()))
+                     for generation, ghosts, future in self.jobs if generation == self.generation)
+
+    def load(self, resolved):
+        self.generation += 1
+        self.requests = {}
+        self.jobs = []
+        self.pending = set()
+        for ghosts, paths in resolved:
+            future = Future()
+            future.set_result(paths)
+            self.jobs.append((self.generation, list(ghosts), future))
+            self.pending.update(ghosts)
+
+
+# настройки, с которыми запускается сама игра; профайлер и запись повторов берут их же
+GAME_OPTIONS = {"ghost_ai": True}
+
+
 class GameController:
-    def __init__(self):
+    def __init__(self, path_cache_dir=None, maze=None, level=None, seed=None, planner_workers: int = 0,
+                 chase_field: bool = True, ghost_ai: bool = False):
         self.maze = [
             "XXXXXXXXXXXXXXXXXXXXXXXXXXXX",
             "XP           XX            X",
@@ -499,11 +1629,15 @@ class GameController:
             "XXXXXXXXXXXXXXXXXXXXXXXXXXXX"
         ]
 
+        if maze is not None:
+            self.maze = list(maze)
+
         self.numpy_maze = []
         self.point_spaces = []
         self.powerup_spaces = []
         self.reachable_spaces = []
         self.ghost_spawns = []
+        self.pacman_spawn = (1, 1)
         self.ghost_colors = [
             "images/ghost.png",
             "images/ghost_pink.png",
@@ -511,11 +1645,58 @@ class GameController:
             "images/ghost_blue.png"
         ]
         self.size = (0, 0)
-        self.convert_maze_to_numpy()
-        self.p = PathFinder(self.numpy_maze)
+        # с какими настройками ИИ собран контроллер; их сохраняет запись повтора
+        self.options = {"chase_field": chase_field, "ghost_ai": ghost_ai, "planner_workers": planner_workers}
+        # свой генератор вместо модуля random; из него берутся зерна партий, если их не задали явно
+        self.rng = random.Random(seed)
+        if level is not None:
+            self.load_compiled_level(level)
+        else:
+            self.convert_maze_to_numpy()
+            self.cookie_grid = np.zeros((self.size[1], self.size[0]), dtype=np.bool_)
+            for col, row in self.point_spaces:
+                self.cookie_grid[row, col] = True
+            self.powerup_grid = np.zeros_like(self.cookie_grid)
+            for col, row in self.powerup_spaces:
+                self.powerup_grid[row, col] = True
+            if path_cache_dir is None:
+                self.p = PathOracle(self.numpy_maze)
+            else:
+                self.p = PathOracle.cached(self.numpy_maze, path_cache_dir)
+        self.collision_grid = CollisionGrid(self.numpy_maze)
+        self.planner_pool = None
+        if planner_workers > 0:
+            self.planner_pool = ThreadPoolExecutor(max_workers=planner_workers, thread_name_prefix="path-planner")
+        self.chase_field = ChaseField(self.p) if chase_field else None
+        self.ghost_ai = GhostAI(self) if ghost_ai else None
+
+    def load_compiled_level(self, level):
+        # готовые массивы из levels.CompiledLevel, без разбора строк
+        passable = ~np.asarray(level.walls)
+        self.maze = level.rows
+        self.size = (passable.shape[1], passable.shape[0])
+        self.numpy_maze = passable.astype(np.uint8)
+        self.point_spaces = [tuple(cell) for cell in np.argwhere(passable)[:, ::-1].tolist()]
+        self.reachable_spaces = list(self.point_spaces)
+        self.powerup_spaces = [tuple(cell) for cell in np.argwhere(level.powerups)[:, ::-1].tolist()]
+        self.ghost_spawns = [tuple(cell) for cell in np.asarray(level.ghost_spawns).tolist()]
+        self.pacman_spawn = tuple(int(value) for value in level.pacman_spawn)
+        self.cookie_grid = level.cookies
+        self.powerup_grid = level.powerups
+        self.p = PathOracle(passable, fields=level.fields)
+
+    def seed(self, seed):
+        self.rng.seed(seed)
+
+    def close(self):
+        if self.planner_pool is not None:
+            self.planner_pool.shutdown(wait=True)
+
+    def random_space(self, rng: random.Random = None):
+        return (self.rng if rng is None else rng).choice(self.reachable_spaces)
 
     def request_random_path(self, ghost: Ghost):
-        random_space = random.choice(self.reachable_spaces)
+        random_space = self.random_space(ghost.renderer.rng)
         maze_coord = screen_to_maze(ghost.get_position())
 
         path = self.p.get_path(maze_coord[1], maze_coord[0], random_space[1],
@@ -530,6 +1711,8 @@ class GameController:
             for y, column in enumerate(row):
                 if column == "G":
                     self.ghost_spawns.append((y, x))
+                if column == "P":
+                    self.pacman_spawn = (y, x)
 
                 if column == "X":
                     binary_row.append(0)
@@ -542,6 +1725,35 @@ class GameController:
 
             self.numpy_maze.append(binary_row)
 
+    def build_level(self, simulation: Simulation, unified_size: int = 32, seed=None):
+        # стены и очки остаются массивами, объектов на каждую клетку нет
+        simulation.set_collision_grid(self.collision_grid)
+        if self.planner_pool is not None:
+            simulation.planner = PathPlanner(self.p, self.planner_pool)
+        simulation.ghost_ai = self.ghost_ai
+        # партии одного контроллера не делят генератор: restore одной не сдвигает другие
+        simulation.rng = random.Random(self.rng.getrandbits(64) if seed is None else seed)
+        simulation.load_pellets(self.cookie_grid, self.powerup_grid)
+
+        for i, ghost_spawn in enumerate(self.ghost_spawns):
+            translated = maze_to_screen(ghost_spawn)
+            ghost = Ghost(simulation, translated[0], translated[1], unified_size, self,
+                          self.ghost_colors[i % 4])
+            simulation.add_ghost(ghost)
+
+        spawn = maze_to_screen(self.pacman_spawn, unified_size)
+        simulation.pacman_spawn = spawn
+        pacman = Pacman(simulation, spawn[0], spawn[1], unified_size)
+        simulation.add_hero(pacman)
+        simulation.set_current_mode(GhostMode.CHASE)
+
+def maze_hash(arr):
+    passable = np.ascontiguousarray(arr, dtype=np.bool_)
+    digest = hashlib.sha1(str(passable.shape).encode())
+    digest.update(passable.tobytes())
+    return digest.hexdigest()
+
+
 def screen_to_maze(coord, size=32):
     return int(coord[0] / size), int(coord[1] / size)
 
@@ -551,32 +1763,9 @@ def maze_to_screen(coord, size=32):
 
 if __name__ == "__main__":
     unified_size = 32
-    pacman_game = GameController()
+    pacman_game = GameController(**GAME_OPTIONS)
     size = pacman_game.size
-    game_renderer = Render(size[0] * unified_size, size[1] * unified_size)
-
-    for y, row in enumerate(pacman_game.numpy_maze):
-        for x, column in enumerate(row):
-            if column == 0:
-                game_renderer.add_wall(Wall(game_renderer, x, y, unified_size))
-
-    for cookie_space in pacman_game.point_spaces:
-        translated = maze_to_screen(cookie_space)
-        cookie = Point(game_renderer, translated[0] + unified_size / 2, translated[1] + unified_size / 2)
-        game_renderer.add_cookie(cookie)
-
-    for powerup_space in pacman_game.powerup_spaces:
-        translated = maze_to_screen(powerup_space)
-        powerup = Powerup(game_renderer, translated[0] + unified_size / 2, translated[1] + unified_size / 2)
-        game_renderer.add_powerup(powerup)
-
-    for i, ghost_spawn in enumerate(pacman_game.ghost_spawns):
-        translated = maze_to_screen(ghost_spawn)
-        ghost = Ghost(game_renderer, translated[0], translated[1], unified_size, pacman_game,
-                      pacman_game.ghost_colors[i % 4])
-        game_renderer.add_ghost(ghost)
-
-    pacman = Pacman(game_renderer, unified_size, unified_size, unified_size)
-    game_renderer.add_hero(pacman)
-    game_renderer.set_current_mode(GhostMode.CHASE)
+    simulation = Simulation(size[0] * unified_size, size[1] * unified_size, tick_rate=120)
+    pacman_game.build_level(simulation, unified_size)
+    game_renderer = Render(simulation, dirty_rendering=True)
     game_renderer.tick(120)
@@ -0,0 +1,265 @@
+import numpy as np
+
+from Pacman import GameController, GhostMode, Movement, Score, MODE_SCHEDULE, POWERUP_SECONDS
+
+# индекс направления = позиция в list(Movement)
+MOVEMENTS = list(Movement)
+NO_INPUT = -1
+NONE = MOVEMENTS.index(Movement.NONE)
+DELTAS = np.zeros((len(MOVEMENTS), 2), dtype=np.int32)
+DELTAS[MOVEMENTS.index(Movement.DOWN)] = (0, 1)
+DELTAS[MOVEMENTS.index(Movement.RIGHT)] = (1, 0)
+DELTAS[MOVEMENTS.index(Movement.UP)] = (0, -1)
+DELTAS[MOVEMENTS.index(Movement.LEFT)] = (-1, 0)
+
+CHASE = GhostMode.CHASE.value
+SCATTER = GhostMode.SCATTER.value
+
+
+def action_index(direction: Movement) -> int:
+    return MOVEMENTS.index(direction)
+
+
+def direction_from_delta(dx, dy):
+    result = np.full(np.shape(dx), NONE, dtype=np.int8)
+    result[dy > 0] = MOVEMENTS.index(Movement.DOWN)
+    result[dy < 0] = MOVEMENTS.index(Movement.UP)
+    result[dx > 0] = MOVEMENTS.index(Movement.RIGHT)
+    result[dx < 0] = MOVEMENTS.index(Movement.LEFT)
+    return result
+
+
+class BatchSimulation:
+    def __init__(self, controller: GameController, n_games: int, tick_rate: int = 120,
+                 unified_size: int = 32, seed=None):
+        self.controller = controller
+        self.n_games = n_games
+        self.tick_rate = tick_rate
+        self.size = unified_size
+        self.rng = np.random.default_rng(seed)
+        self.oracle = controller.p
+
+        walls = controller.collision_grid.walls
+        self.rows, self.cols = walls.shape
+        self.width = self.cols * unified_size
+        self.height = self.rows * unified_size
+        # рамка из пустых клеток: за краем лабиринта стен нет (туннель)
+        self.padded_walls = np.pad(walls, 1, constant_values=False)
+
+        self.cookie_template = controller.cookie_grid
+        self.powerup_template = controller.powerup_grid
+
+        self.pacman_spawn = np.array(controller.pacman_spawn, dtype=np.int32) * unified_size
+        self.ghost_spawns = np.array([(col * unified_size, row * unified_size)
+                                      for col, row in controller.ghost_spawns], dtype=np.int32).reshape(-1, 2)
+        self.n_ghosts = len(self.ghost_spawns)
+        self.reachable = self.oracle.cells
+        self.schedule = np.array(MODE_SCHEDULE, dtype=np.int64) * tick_rate
+        self.powerup_ticks = POWERUP_SECONDS * tick_rate
+
+        n, g = n_games, self.n_ghosts
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.pacman_pos = np.zeros((n, 2), dtype=np.int32)
+        self.pacman_dir = np.zeros(n, dtype=np.int8)
+        self.pacman_buff = np.zeros(n, dtype=np.int8)
+        self.pacman_last = np.zeros(n, dtype=np.int8)
+        self.ghost_pos = np.zeros((n, g, 2), dtype=np.int32)
+        self.ghost_dir = np.zeros((n, g), dtype=np.int8)
+        self.ghost_alive = np.zeros((n, g), dtype=np.bool_)
+        self.ghost_target = np.zeros((n, g, 2), dtype=np.int32)  # (row, col) для блуждания
+        self.cookies = np.zeros((n,) + walls.shape, dtype=np.bool_)
+        self.powerups = np.zeros((n,) + walls.shape, dtype=np.bool_)
+        self.cookies_left = np.zeros(n, dtype=np.int32)
+        self.score = np.zeros(n, dtype=np.int32)
+        self.lives = np.zeros(n, dtype=np.int8)
+        self.won = np.zeros(n, dtype=np.bool_)
+        self.alive = np.zeros(n, dtype=np.bool_)
+        self.powerup_active = np.zeros(n, dtype=np.bool_)
+        self.powerup_end = np.zeros(n, dtype=np.int64)
+        self.mode = np.zeros(n, dtype=np.int8)
+        self.phase = np.zeros(n, dtype=np.int8)
+        self.mode_switch = np.zeros(n, dtype=np.int64)
+        self.reset()
+
+    def reset(self, mask=None):
+        games = np.arange(self.n_games) if mask is None else np.flatnonzero(mask)
+        if len(games) == 0:
+            return
+        self.ticks[games] = 0
+        self.pacman_pos[games] = self.pacman_spawn
+        self.pacman_dir[games] = NONE
+        self.pacman_buff[games] = NONE
+        self.pacman_last[games] = NONE
+        self.ghost_pos[games] = self.ghost_spawns
+        self.ghost_dir[games] = NONE
+        self.ghost_alive[games] = True
+        self.ghost_target[games] = self.random_cells((len(games), self.n_ghosts))
+        self.cookies[games] = self.cookie_template
+        self.powerups[games] = self.powerup_template
+        self.cookies_left[games] = self.cookie_template.sum()
+        self.score[games] = 0
+        self.lives[games] = 3
+        self.won[games] = False
+        self.alive[games] = True
+        self.powerup_active[games] = False
+        # как Simulation.start после set_current_mode(CHASE): сразу первая фаза scatter
+        self.mode[games] = SCATTER
+        self.phase[games] = 1
+        self.mode_switch[games] = self.schedule[0, 0]
+
+    def done(self):
+        return self.won | ~self.alive
+
+    def random_cells(self, shape):
+        return self.reachable[self.rng.integers(len(self.reachable), size=shape)]
+
+    def step(self, actions=None):
+        active = ~self.done()
+        score_before = self.score.copy()
+
+        if actions is not None:
+            actions = np.asarray(actions)
+            pressed = active & (actions >= 0)
+            self.pacman_dir[pressed] = actions[pressed]
+            self.pacman_buff[pressed] = actions[pressed]
+
+        self.move_ghosts(active)
+        self.move_pacman(active)
+        self.pickup_pellets(active)
+        self.handle_ghosts(active)
+
+        self.ticks[active] += 1
+        self.handle_timers(active)
+        return self.score - score_before, self.done()
+
+    def collides(self, positions):
+        # прямоугольник размером с клетку задевает не больше 2x2 клеток
+        first = positions // self.size
+        last = (positions + self.size - 1) // self.size
+        first_col = np.clip(first[..., 0], -1, self.cols) + 1
+        first_row = np.clip(first[..., 1], -1, self.rows) + 1
+        last_col = np.clip(last[..., 0], -1, self.cols) + 1
+        last_row = np.clip(last[..., 1], -1, self.rows) + 1
+        walls = self.padded_walls
+        return walls[first_row, first_col] | walls[first_row, last_col] \
+            | walls[last_row, first_col] | walls[last_row, last_col]
+
+    def move_pacman(self, active):
+        pos = self.pacman_pos
+        x = pos[:, 0]
+        # Телепорт
+        x[active & (x < 0)] = self.width
+        x[active & (x > self.width)] = 0
+
+        current = self.pacman_dir.copy()
+        buffered = self.pacman_buff
+        last = self.pacman_last.copy()
+
+        buff_blocked = (buffered != NONE) & self.collides(pos + DELTAS[buffered])
+        move_dir = np.where(buff_blocked, current, buffered)
+        move_blocked = (move_dir != NONE) & self.collides(pos + DELTAS[move_dir])
+        moving = active & ~move_blocked
+
+        pos[moving] += DELTAS[move_dir[moving]]
+        self.pacman_last = np.where(moving, current, last).astype(np.int8)
+        new_dir = np.where(buff_blocked, np.where(move_blocked, last, current), buffered)
+        self.pacman_dir = np.where(active, new_dir, current).astype(np.int8)
+
+    def pellet_hits(self, pellets, active, pellet_size: int):
+        # пересечение прямоугольника Пакмана с Rect(центр клетки, pellet_size)
+        half = self.size // 2
+        low = (self.pacman_pos - half - pellet_size) // self.size + 1
+        high = -((half - self.pacman_pos - self.size) // self.size) - 1
+        games = np.arange(self.n_games)
+        hits = np.zeros(pellets.shape, dtype=np.bool_)
+        for d_row in (0, 1):
+            for d_col in (0, 1):
+                rows = low[:, 1] + d_row
+                cols = low[:, 0] + d_col
+                inside = active & (rows <= high[:, 1]) & (cols <= high[:, 0]) \
+                    & (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+                hit_games = games[inside]
+                hit_rows = rows[inside]
+                hit_cols = cols[inside]
+                hits[hit_games, hit_rows, hit_cols] = pellets[hit_games, hit_rows, hit_cols]
+        return hits
+
+    def pickup_pellets(self, active):
+        eaten = self.pellet_hits(self.cookies, active, 4)
+        eaten_count = eaten.sum(axis=(1, 2), dtype=np.int32)
+        self.cookies &= ~eaten
+        self.cookies_left -= eaten_count
+        self.score += eaten_count * Score.COOKIE.value
+        self.won |= active & (self.cookies_left == 0)
+
+        can_pickup = active & ~self.powerup_active
+        taken = self.pellet_hits(self.powerups, can_pickup, 8)
+        taken_count = taken.sum(axis=(1, 2), dtype=np.int32)
+        self.powerups &= ~taken
+        self.score += taken_count * Score.POWERUP.value
+        started = taken_count > 0
+        self.powerup_active |= started
+        self.mode[started] = SCATTER
+        self.powerup_end[started] = self.ticks[started] + self.powerup_ticks
+
+    def handle_ghosts(self, active):
+        offset = np.abs(self.ghost_pos - self.pacman_pos[:, None, :])
+        touching = self.ghost_alive & (offset < self.size).all(axis=2) & active[:, None]
+        eaten = touching & self.powerup_active[:, None]
+        self.ghost_alive &= ~eaten
+        self.score += eaten.sum(axis=1, dtype=np.int32) * Score.GHOST.value
+
+        hits = (touching & ~self.powerup_active[:, None]).sum(axis=1) * ~self.won
+        killed = hits > 0
+        self.lives = np.maximum(self.lives - hits, 0).astype(np.int8)
+        self.pacman_pos[killed] = self.pacman_spawn
+        self.pacman_dir[killed] = NONE
+        self.pacman_buff[killed] = NONE
+        self.alive &= self.lives > 0
+
+    def move_ghosts(self, active):
+        moving = self.ghost_alive & active[:, None]
+        aligned = moving & ((self.ghost_pos % self.size) == 0).all(axis=2)
+        if aligned.any():
+            self.retarget_ghosts(aligned)
+        step = DELTAS[self.ghost_dir] * moving[..., None]
+        self.ghost_pos += step
+
+    def retarget_ghosts(self, aligned):
+        tiles = self.ghost_pos[..., ::-1] // self.size  # (row, col)
+        chasing = (self.mode == CHASE) & ~self.powerup_active
+        hero_tiles = np.where(self.alive[:, None], self.pacman_pos[:, ::-1] // self.size, 0)
+
+        wandering = aligned & ~chasing[:, None]
+        arrived = wandering & (tiles == self.ghost_target).all(axis=2)
+        if arrived.any():
+            self.ghost_target[arrived] = self.random_cells(arrived.sum())
+
+        targets = np.where(chasing[:, None, None], hero_tiles[:, None, :], self.ghost_target)[aligned]
+        sources = tiles[aligned]
+        next_rows, next_cols = self.oracle.next_steps(sources[:, 0], sources[:, 1], targets[:, 0], targets[:, 1])
+        has_step = next_rows >= 0
+        d_row = np.where(has_step, next_rows - sources[:, 0], 0)
+        d_col = np.where(has_step, next_cols - sources[:, 1], 0)
+        self.ghost_dir[aligned] = direction_from_delta(d_col, d_row)
+
+        # цель недостижима: выбираем новую в следующий раз
+        stuck = np.zeros(aligned.shape, dtype=np.bool_)
+        stuck[aligned] = ~has_step
+        stuck &= ~chasing[:, None]
+        if stuck.any():
+            self.ghost_target[stuck] = self.random_cells(stuck.sum())
+
+    def handle_timers(self, active):
+        switching = active & (self.ticks == self.mode_switch)
+        if switching.any():
+            # как в Simulation.switch_mode: длительность берется из фазы до переключения
+            was_chase = self.mode == CHASE
+            timing = np.where(was_chase, self.schedule[self.phase, 0], self.schedule[self.phase, 1])
+            self.phase = np.where(switching & was_chase,
+                                  np.minimum(self.phase + 1, len(self.schedule) - 1), self.phase).astype(np.int8)
+            self.mode = np.where(switching, np.where(was_chase, SCATTER, CHASE), self.mode).astype(np.int8)
+            self.mode_switch = np.where(switching, self.ticks + timing, self.mode_switch)
+
+        ending = active & self.powerup_active & (self.ticks == self.powerup_end)
+        self.powerup_active &= ~ending
@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from Pacman import GameController, Ghost, Movement, Pacman, Simulation
+from mazegen import generate_maze
+
+DIRECTIONS = (Movement.UP, Movement.DOWN, Movement.LEFT, Movement.RIGHT)
+
+
+class PhaseTimer:
+    # замер фаз обертками поверх настоящих методов, сам Simulation.step не копируется
+    def __init__(self):
+        self.phases = {}
+        self.wrapped = []
+
+    def wrap(self, owner, name: str, phase: str):
+        function = getattr(owner, name)
+        phases = self.phases
+        phases.setdefault(phase, 0.0)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                phases[phase] += time.perf_counter() - start
+
+        self.wrapped.append((owner, name, vars(owner).get(name)))
+        setattr(owner, name, timed)
+
+    def restore(self):
+        for owner, name, original in reversed(self.wrapped):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.wrapped = []
+
+
+def run_config(width: int, height: int, ghosts: int, ticks: int, seed: int = 0,
+               render: bool = False, batch: int = 0, unified_size: int = 32, controller_options=None):
+    # память меряется только на подготовке: под tracemalloc тики идут в разы медленнее
+    tracemalloc.start()
+    setup = {}
+
+    start = time.perf_counter()
+    rows = generate_maze(width, height, ghosts=ghosts, seed=seed)
+    setup["generate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    controller = GameController(maze=rows, **(controller_options or {}))
+    setup["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    simulation = Simulation(controller.size[0] * unified_size, controller.size[1] * unified_size)
+    controller.build_level(simulation, unified_size)
+    setup["build"] = time.perf_counter() - start
+
+    # таблица путей строится лениво при первом запросе; строим ее здесь, чтобы она попала в замер памяти,
+    # а не в первый тик и фазу призраков
+    start = time.perf_counter()
+    controller.p.fields
+    setup["paths"] = time.perf_counter() - start
+    setup_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    renderer = None
+    if render:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        from Pacman import Render
+        renderer = Render(simulation, dirty_rendering=True)
+
+    simulation.seed(seed)
+    rng = random.Random(seed)
+    timer = PhaseTimer()
+    # классы обертываются целиком: у объектов со __slots__ нет своего __dict__
+    timer.wrap(Ghost, "tick", "ghosts")
+    timer.wrap(Pacman, "tick", "pacman")
+    if simulation.ghost_ai is not None:
+        timer.wrap(simulation.ghost_ai, "update", "ghost_ai")
+    if simulation.planner is not None:
+        timer.wrap(simulation.planner, "collect", "planner")
+        timer.wrap(simulation.planner, "flush", "planner")
+    if renderer is not None:
+        timer.wrap(renderer, "draw_frame", "render")
+    timer.wrap(simulation, "step", "step")
+    loop_start = time.perf_counter()
+    try:
+        for tick in range(ticks):
+            action = rng.choice(DIRECTIONS) if tick % 32 == 0 else None
+            simulation.step(action)
+            if renderer is not None:
+                renderer.draw_frame()
+    finally:
+        timer.restore()
+    elapsed = time.perf_counter() - loop_start
+    phases = timer.phases
+    # таймеры, наблюдатели и прочее, что step делает вне обернутых фаз
+    phases["other"] = phases.pop("step") - sum(value for name, value in phases.items() if name != "render")
+
+    result = {
+        "width": width,
+        "height": height,
+        "ghosts": len(controller.ghost_spawns),
+        "ticks": ticks,
+        "ticks_per_sec": ticks / elapsed if elapsed else float("inf"),
+        "setup_ms": {name: value * 1000 for name, value in setup.items()},
+        "phase_us_per_tick": {name: value * 1e6 / ticks for name, value in phases.items()},
+        "setup_peak_mb": setup_peak / 2 ** 20,
+    }
+
+    if batch:
+        from batch import BatchSimulation
+        games = BatchSimulation(controller, batch, seed=seed)
+        batch_start = time.perf_counter()
+        for _ in range(ticks):
+            games.step(games.rng.integers(0, 4, size=batch))
+        batch_elapsed = time.perf_counter() - batch_start
+        result["batch_game_ticks_per_sec"] = batch * ticks / batch_elapsed
+    return result
+
+
+def print_result(result):
+    phases = " ".join(f"{name}={value:.1f}us" for name, value in result["phase_us_per_tick"].items())
+    setup = " ".join(f"{name}={value:.0f}ms" for name, value in result["setup_ms"].items())
+    line = (f"{result['width']}x{result['height']} ghosts={result['ghosts']}: "
+            f"{result['ticks_per_sec']:.0f} ticks/s | {phases} | {setup} | "
+            f"setup peak {result['setup_peak_mb']:.1f} MB")
+    if "batch_game_ticks_per_sec" in result:
+        line += f" | batch {result['batch_game_ticks_per_sec']:.0f} game-ticks/s"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how the engine scales with board size and ghost count")
+    parser.add_argument("--sizes", default="28x22,100x100,200x200", help="comma separated WxH list")
+    parser.add_argument("--ghosts", default="4,16,64", help="comma separated ghost counts")
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--render", action="store_true", help="also draw every frame (SDL dummy driver)")
+    parser.add_argument("--batch", type=int, default=0, help="also step N games in BatchSimulation")
+    parser.add_argument("--json", default=None, help="write all results to this file")
+    parser.add_argument("--ghost-ai", action="store_true", help="move ghosts with the vectorized GhostAI")
+    parser.add_argument("--planner-workers", type=int, default=0)
+    args = parser.parse_args()
+    options = {"ghost_ai": args.ghost_ai, "planner_workers": args.planner_workers}
+
+    results = []
+    for size in args.sizes.split(","):
+        width, height = (int(value) for value in size.lower().split("x"))
+        for ghost_count in (int(value) for value in args.ghosts.split(",")):
+            result = run_config(width, height, ghost_count, args.ticks, args.seed, args.render, args.batch,
+                                controller_options=options)
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,232 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+from Pacman import GameController, Simulation, SimulationObserver
+from batch import MOVEMENTS, NO_INPUT
+
+DATASET_VERSION = 2
+# номер партии: старшие 32 бита - ключ писателя, младшие - счетчик партий внутри него
+EPISODE_BITS = 32
+
+
+def transition_dtype(shape, entities: int):
+    # одна строка = наблюдение до шага, действие и его последствия; очки хранятся битами
+    cells = shape[0] * shape[1]
+    packed = (cells + 7) // 8
+    return np.dtype([
+        ("episode", "<i8"),
+        ("tick", "<i4"),
+        ("cookies", "u1", (packed,)),
+        ("powerups", "u1", (packed,)),
+        ("positions", "<i2", (entities, 2)),  # x, y в пикселях, последним идет Пакман
+        ("alive", "u1", ((entities + 7) // 8,)),
+        ("score", "<i4"),
+        ("lives", "i1"),
+        ("mode", "i1"),
+        ("powerup", "?"),
+        ("action", "i1"),
+        ("reward", "<i4"),
+        ("done", "?"),
+    ])
+
+
+class TrajectoryWriter:
+    # каждый писатель пишет свои файлы, поэтому параллельным процессам не нужны блокировки
+    def __init__(self, directory, shape, entities: int, chunk_size: int = 65536, writer_id=None):
+        self.directory = directory
+        self.shape = tuple(shape)
+        self.entities = entities
+        self.dtype = transition_dtype(self.shape, entities)
+        self.chunk_size = chunk_size
+        self.writer_id = writer_id or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # ключ из имени писателя делает номера партий уникальными на весь каталог
+        digest = hashlib.blake2b(self.writer_id.encode(), digest_size=4).digest()
+        self.writer_key = int.from_bytes(digest, "little") >> 1
+        self.sequence = 0
+        self.chunk = None
+        self.chunk_path = None
+        self.count = 0
+        self.episodes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def for_controller(cls, directory, controller: GameController, **kwargs):
+        return cls(directory, (controller.size[1], controller.size[0]), len(controller.ghost_spawns) + 1, **kwargs)
+
+    def open_chunk(self):
+        name = f"{self.writer_id}-{self.sequence:05d}"
+        self.sequence += 1
+        self.chunk_path = os.path.join(self.directory, name + ".npy")
+        self.chunk = np.lib.format.open_memmap(self.chunk_path + ".tmp", mode="w+", dtype=self.dtype,
+                                               shape=(self.chunk_size,))
+        self.count = 0
+
+    def finish_chunk(self):
+        if self.chunk is None:
+            return
+        tmp_path = self.chunk_path + ".tmp"
+        if self.count < self.chunk_size:
+            # неполный чанк переписываем по размеру, чтобы не хранить пустой хвост
+            np.save(self.chunk_path, self.chunk[:self.count])
+            del self.chunk
+            os.remove(tmp_path)
+        else:
+            self.chunk.flush()
+            del self.chunk
+            os.replace(tmp_path, self.chunk_path)
+        # индекс пишется последним: читатель видит только законченные чанки
+        meta = {"version": DATASET_VERSION, "count": self.count, "shape": list(self.shape),
+                "entities": self.entities, "file": os.path.basename(self.chunk_path),
+                "writer": self.writer_id, "writer_key": self.writer_key}
+        index_path = self.chunk_path[:-4] + ".json"
+        with open(index_path + ".tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(index_path + ".tmp", index_path)
+        self.chunk = None
+
+    def append(self, row):
+        if self.chunk is None:
+            self.open_chunk()
+        self.chunk[self.count] = row
+        self.count += 1
+        if self.count == self.chunk_size:
+            self.finish_chunk()
+
+    def attach(self, simulation: Simulation):
+        recorder = TrajectoryRecorder(self, simulation, (self.writer_key << EPISODE_BITS) | self.episodes)
+        self.episodes += 1
+        return recorder
+
+    def close(self):
+        self.finish_chunk()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TrajectoryRecorder(SimulationObserver):
+    # наблюдатель Simulation: после каждого шага пишет строку с наблюдением, которое было до него
+    def __init__(self, writer: TrajectoryWriter, simulation: Simulation, episode: int):
+        self.writer = writer
+        self.episode = episode
+        self.row = np.zeros((), dtype=writer.dtype)
+        self.observe(simulation)
+        simulation.add_observer(self)
+
+    def observe(self, simulation: Simulation):
+        row = self.row
+        pellets = simulation.get_pellets()
+        row["episode"] = self.episode
+        row["tick"] = simulation.ticks
+        row["cookies"] = np.packbits(pellets.cookies)
+        row["powerups"] = np.packbits(pellets.powerups)
+        spatial_hash = simulation.get_spatial_hash()
+        ghosts = simulation.get_ghosts()
+        positions = np.zeros((self.writer.entities, 2), dtype=np.int16)
+        alive = np.zeros(self.writer.entities, dtype=np.bool_)
+        for slot, ghost in enumerate(ghosts[:self.writer.entities - 1]):
+            positions[slot] = ghost.x, ghost.y
+            alive[slot] = ghost in spatial_hash
+        if simulation.pacman is not None:
+            positions[-1] = simulation.pacman.get_position()
+            alive[-1] = True
+        row["positions"] = positions
+        row["alive"] = np.packbits(alive)
+        row["score"] = simulation.score
+        row["lives"] = simulation.lives
+        row["mode"] = simulation.get_current_mode().value
+        row["powerup"] = simulation.is_powerup_active()
+
+    def on_step(self, simulation: Simulation):
+        row = self.row
+        action = simulation.last_action
+        row["action"] = NO_INPUT if action is None else MOVEMENTS.index(action)
+        row["reward"] = simulation.score - row["score"]
+        row["done"] = simulation.is_over()
+        self.writer.append(row)
+        self.observe(simulation)
+
+    def on_reset(self, simulation: Simulation):
+        # после restore отложенное наблюдение устарело
+        self.observe(simulation)
+
+
+class TrajectoryDataset:
+    # читает законченные чанки через mmap; минибатчи собираются без загрузки файлов целиком
+    def __init__(self, directory):
+        self.directory = directory
+        self.chunks = []
+        self.shape = None
+        self.entities = None
+        for index_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            with open(index_path) as file:
+                meta = json.load(file)
+            if meta["version"] != DATASET_VERSION:
+                raise ValueError(f"unsupported dataset version {meta['version']} in {index_path}")
+            if meta["count"] == 0:
+                continue
+            if self.shape is None:
+                self.shape = tuple(meta["shape"])
+                self.entities = meta["entities"]
+            elif tuple(meta["shape"]) != self.shape or meta["entities"] != self.entities:
+                raise ValueError(f"{index_path} was recorded on a different level")
+            array = np.load(os.path.join(directory, meta["file"]), mmap_mode="r")
+            self.chunks.append(array[:meta["count"]])
+        self.offsets = np.cumsum([0] + [len(chunk) for chunk in self.chunks])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def rows(self, indices):
+        indices = np.asarray(indices)
+        chunk_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        result = np.empty(len(indices), dtype=self.chunks[0].dtype)
+        for chunk_id in np.unique(chunk_ids):
+            selected = chunk_ids == chunk_id
+            result[selected] = self.chunks[chunk_id][indices[selected] - self.offsets[chunk_id]]
+        return result
+
+    def unpack(self, rows):
+        cells = self.shape[0] * self.shape[1]
+        shape = (len(rows),) + self.shape
+        return {
+            "cookies": np.unpackbits(rows["cookies"], axis=1, count=cells).reshape(shape).astype(np.bool_),
+            "powerups": np.unpackbits(rows["powerups"], axis=1, count=cells).reshape(shape).astype(np.bool_),
+            "positions": rows["positions"],
+            "alive": np.unpackbits(rows["alive"], axis=1, count=self.entities).astype(np.bool_),
+            **{name: rows[name] for name in ("episode", "tick", "score", "lives", "mode", "powerup",
+                                             "action", "reward", "done")},
+        }
+
+    def sample(self, batch_size: int, rng: np.random.Generator = None, unpack: bool = True):
+        rng = np.random.default_rng() if rng is None else rng
+        rows = self.rows(np.sort(rng.integers(len(self), size=batch_size)))
+        return self.unpack(rows) if unpack else rows
+
+    def batches(self, batch_size: int, rng: np.random.Generator = None, unpack: bool = True):
+        # одна эпоха случайных минибатчей без повторов
+        rng = np.random.default_rng() if rng is None else rng
+        order = rng.permutation(len(self))
+        for start in range(0, len(order), batch_size):
+            rows = self.rows(np.sort(order[start:start + batch_size]))
+            yield self.unpack(rows) if unpack else rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a trajectory dataset directory")
+    parser.add_argument("directory")
+    args = parser.parse_args()
+
+    dataset = TrajectoryDataset(args.directory)
+    size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(args.directory, "*.npy")))
+    print(f"{len(dataset)} transitions in {len(dataset.chunks)} chunks, {size / 2 ** 20:.1f} MB, "
+          f"{size / max(len(dataset), 1):.0f} bytes per transition")
@@ -0,0 +1,107 @@
+import time
+
+import numpy as np
+
+from Pacman import GameController, Simulation
+from batch import MOVEMENTS, NO_INPUT
+
+CHANNELS = ("walls", "cookies", "powerups", "ghosts", "pacman", "frightened")
+SCALARS = ("score", "lives", "current_mode", "powerup_active", "cookies_left", "ticks")
+
+
+class PacmanEnv:
+    # reset/step в духе gym; наблюдения пишутся в одни и те же массивы, копируйте их, если нужна история
+    def __init__(self, controller: GameController = None, max_ticks: int = 20000, frame_skip: int = 1,
+                 unified_size: int = 32, tick_rate: int = 120):
+        self.controller = GameController() if controller is None else controller
+        self.max_ticks = max_ticks
+        self.frame_skip = frame_skip
+        self.tile = unified_size
+        columns, rows = self.controller.size
+        self.simulation = Simulation(columns * unified_size, rows * unified_size, tick_rate)
+        self.controller.build_level(self.simulation, unified_size)
+        # начальное состояние сохраняется один раз, reset только восстанавливает его
+        self.initial = self.simulation.snapshot()
+
+        self.grid = np.zeros((len(CHANNELS), rows, columns), dtype=np.float32)
+        self.scalars = np.zeros(len(SCALARS), dtype=np.float32)
+        self.observation = {"grid": self.grid, "scalars": self.scalars}
+        self.grid[CHANNELS.index("walls")] = self.controller.collision_grid.walls
+        self.action_count = len(MOVEMENTS)
+
+    def reset(self, seed=None):
+        # restore возвращает и генератор партии, поэтому зерно задается после него
+        self.simulation.restore(self.initial)
+        self.simulation.seed(seed)
+        return self.observe(), self.info()
+
+    def step(self, action):
+        simulation = self.simulation
+        direction = None if action is None or action == NO_INPUT else MOVEMENTS[action]
+        score = simulation.score
+        terminated = False
+        for _ in range(self.frame_skip):
+            terminated = simulation.step(direction)
+            direction = None
+            if terminated:
+                break
+        # награда складывается из тех же значений Score, что начисляет игра
+        reward = simulation.score - score
+        truncated = not terminated and simulation.ticks >= self.max_ticks
+        return self.observe(), reward, terminated, truncated, self.info()
+
+    def observe(self):
+        simulation = self.simulation
+        pellets = simulation.get_pellets()
+        grid = self.grid
+        np.copyto(grid[1], pellets.cookies)
+        np.copyto(grid[2], pellets.powerups)
+        grid[3:].fill(0)
+        for ghost in simulation.movables:
+            if ghost is not simulation.pacman:
+                self.mark(grid[3], ghost)
+        if simulation.is_powerup_active():
+            np.copyto(grid[5], grid[3])
+        if simulation.pacman is not None:
+            self.mark(grid[4], simulation.pacman)
+
+        scalars = self.scalars
+        scalars[0] = simulation.score
+        scalars[1] = simulation.lives
+        scalars[2] = simulation.get_current_mode().value
+        scalars[3] = simulation.is_powerup_active()
+        scalars[4] = pellets.cookies_left()
+        scalars[5] = simulation.ticks
+        return self.observation
+
+    def mark(self, channel, obj):
+        # клетка по центру объекта; за краем лабиринта (туннель) не отмечаем
+        half = obj._size // 2
+        col = int((obj.x + half) // self.tile)
+        row = int((obj.y + half) // self.tile)
+        if 0 <= row < channel.shape[0] and 0 <= col < channel.shape[1]:
+            channel[row, col] = 1
+
+    def info(self):
+        simulation = self.simulation
+        return {"ticks": simulation.ticks, "won": simulation.get_won(), "lives": simulation.lives}
+
+    def sample_action(self, rng: np.random.Generator):
+        return int(rng.integers(self.action_count))
+
+
+if __name__ == "__main__":
+    env = PacmanEnv(frame_skip=8)
+    rng = np.random.default_rng(0)
+    observation, _ = env.reset(seed=0)
+    start = time.perf_counter()
+    steps = 0
+    total = 0
+    for _ in range(5000):
+        observation, reward, terminated, truncated, _ = env.step(env.sample_action(rng))
+        total += reward
+        steps += 1
+        if terminated or truncated:
+            env.reset(seed=steps)
+    elapsed = time.perf_counter() - start
+    print(f"{steps / elapsed:.0f} env steps/s, {steps * env.frame_skip / elapsed:.0f} ticks/s, reward {total}")
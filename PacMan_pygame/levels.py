@@ -0,0 +1,119 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from Pacman import GameController, PathOracle
+
+ARTIFACT_VERSION = 1
+ARRAYS = ("walls", "cookies", "powerups", "ghost_spawns", "pacman_spawn")
+
+
+class CompiledLevel:
+    def __init__(self, rows, walls, cookies, powerups, ghost_spawns, pacman_spawn, fields, content_hash):
+        self.rows = rows
+        self.walls = walls
+        self.cookies = cookies
+        self.powerups = powerups
+        self.ghost_spawns = ghost_spawns  # (n, 2): col, row
+        self.pacman_spawn = pacman_spawn  # col, row
+        self.fields = fields  # None, если лабиринт больше all_pairs_limit
+        self.content_hash = content_hash
+
+    @property
+    def size(self):
+        return self.walls.shape[1], self.walls.shape[0]
+
+    def controller(self, path_cache_dir=None) -> GameController:
+        return GameController(path_cache_dir, level=self)
+
+    def save(self, directory):
+        # пишем во временную папку и переименовываем, чтобы параллельные процессы не видели половину файлов
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".level-", dir=parent)
+        try:
+            for name in ARRAYS:
+                np.save(os.path.join(tmp_dir, name + ".npy"), np.asarray(getattr(self, name)))
+            if self.fields is not None:
+                np.save(os.path.join(tmp_dir, "fields.npy"), np.asarray(self.fields))
+            with open(os.path.join(tmp_dir, "level.json"), "w") as file:
+                json.dump({"version": ARTIFACT_VERSION, "hash": self.content_hash, "rows": self.rows}, file)
+            os.replace(tmp_dir, directory)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(directory):
+                raise
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "level.json")) as file:
+            meta = json.load(file)
+        if meta["version"] != ARTIFACT_VERSION:
+            raise ValueError(f"unsupported level artifact version {meta['version']}")
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode='r') for name in ARRAYS}
+        fields_path = os.path.join(directory, "fields.npy")
+        fields = np.load(fields_path, mmap_mode='r') if os.path.exists(fields_path) else None
+        return cls(meta["rows"], fields=fields, content_hash=meta["hash"], **arrays)
+
+
+def parse_rows(text):
+    rows = [line.rstrip("\r\n") for line in text.splitlines()]
+    while rows and not rows[-1].strip():
+        rows.pop()
+    if not rows:
+        raise ValueError("level is empty")
+    width = max(len(row) for row in rows)
+    # короткие строки добиваем стеной, чтобы лабиринт был прямоугольным
+    return [row.ljust(width, "X") for row in rows]
+
+
+def level_hash(rows):
+    return hashlib.sha1("\n".join(rows).encode()).hexdigest()
+
+
+def compile_rows(rows, all_pairs_limit: int = 4096) -> CompiledLevel:
+    chars = np.array([np.frombuffer(row.encode("ascii"), dtype=np.uint8) for row in rows])
+    walls = chars == ord("X")
+    cookies = ~walls
+    powerups = chars == ord("O")
+    ghost_spawns = np.argwhere(chars == ord("G"))[:, ::-1].astype(np.int32)
+    pacman = np.argwhere(chars == ord("P"))[:, ::-1]
+    pacman_spawn = pacman[0].astype(np.int32) if len(pacman) else np.array((1, 1), dtype=np.int32)
+    fields = PathOracle(cookies, all_pairs_limit=all_pairs_limit).fields
+    return CompiledLevel(rows, walls, cookies, powerups, ghost_spawns.reshape(-1, 2), pacman_spawn,
+                         fields, level_hash(rows))
+
+
+def load_level(path, cache_dir=None, all_pairs_limit: int = 4096) -> CompiledLevel:
+    with open(path) as file:
+        rows = parse_rows(file.read())
+    if cache_dir is None:
+        return compile_rows(rows, all_pairs_limit)
+
+    directory = os.path.join(cache_dir, level_hash(rows))
+    if os.path.isdir(directory):
+        return CompiledLevel.load(directory)
+    level = compile_rows(rows, all_pairs_limit)
+    level.save(directory)
+    return CompiledLevel.load(directory)
+
+
+def write_level(path, rows):
+    with open(path, "w") as file:
+        file.write("\n".join(rows) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile level files into memory-mappable cache artifacts")
+    parser.add_argument("levels", nargs="+")
+    parser.add_argument("--cache-dir", default=".level_cache")
+    args = parser.parse_args()
+
+    for level_path in args.levels:
+        compiled = load_level(level_path, args.cache_dir)
+        print(f"{level_path}: {compiled.size[0]}x{compiled.size[1]} -> {compiled.content_hash}")
@@ -0,0 +1,80 @@
+import argparse
+import random
+
+from levels import write_level
+
+
+def generate_maze(width: int, height: int, ghosts: int = 4, powerups: int = 4, braid: float = 0.5, seed=None):
+    if width < 5 or height < 5:
+        raise ValueError("maze must be at least 5x5")
+    rng = random.Random(seed)
+    grid = [["X"] * width for _ in range(height)]
+
+    # клетки лабиринта на нечетных координатах, стены между ними
+    cell_cols = range(1, width - 1, 2)
+    cell_rows = range(1, height - 1, 2)
+    start = (1, 1)
+    grid[1][1] = " "
+    stack = [start]
+    while stack:
+        col, row = stack[-1]
+        options = []
+        for d_col, d_row in ((2, 0), (-2, 0), (0, 2), (0, -2)):
+            next_col, next_row = col + d_col, row + d_row
+            if next_col in cell_cols and next_row in cell_rows and grid[next_row][next_col] == "X":
+                options.append((next_col, next_row))
+        if not options:
+            stack.pop()
+            continue
+        next_col, next_row = rng.choice(options)
+        grid[(row + next_row) // 2][(col + next_col) // 2] = " "
+        grid[next_row][next_col] = " "
+        stack.append((next_col, next_row))
+
+    # убираем часть тупиков, чтобы появились циклы, как в обычном Пакмане
+    for row in cell_rows:
+        for col in cell_cols:
+            if rng.random() >= braid:
+                continue
+            exits = 0
+            candidates = []
+            for d_col, d_row in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+                if grid[row + d_row][col + d_col] != "X":
+                    exits += 1
+                elif col + 2 * d_col in cell_cols and row + 2 * d_row in cell_rows:
+                    candidates.append((col + d_col, row + d_row))
+            if exits == 1 and candidates:
+                wall_col, wall_row = rng.choice(candidates)
+                grid[wall_row][wall_col] = " "
+
+    open_cells = [(col, row) for row in range(height) for col in range(width)
+                  if grid[row][col] == " " and (col, row) != start]
+    rng.shuffle(open_cells)
+    grid[start[1]][start[0]] = "P"
+
+    # призраки подальше от старта Пакмана
+    open_cells.sort(key=lambda cell: abs(cell[0] - start[0]) + abs(cell[1] - start[1]), reverse=True)
+    far_half = open_cells[:max(len(open_cells) // 2, 1)]
+    for col, row in rng.sample(far_half, min(ghosts, len(far_half))):
+        grid[row][col] = "G"
+
+    free = [cell for cell in open_cells if grid[cell[1]][cell[0]] == " "]
+    for col, row in rng.sample(free, min(powerups, len(free))):
+        grid[row][col] = "O"
+
+    return ["".join(row) for row in grid]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a seeded maze in the X/O/G/P level format")
+    parser.add_argument("width", type=int)
+    parser.add_argument("height", type=int)
+    parser.add_argument("output")
+    parser.add_argument("--ghosts", type=int, default=4)
+    parser.add_argument("--powerups", type=int, default=4)
+    parser.add_argument("--braid", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    write_level(args.output, generate_maze(args.width, args.height, args.ghosts, args.powerups,
+                                           args.braid, args.seed))
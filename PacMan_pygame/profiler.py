@@ -0,0 +1,163 @@
+import argparse
+import csv
+import json
+from time import perf_counter
+
+import numpy as np
+
+from Pacman import GAME_OPTIONS, GameController, Render, Simulation
+
+PHASES = ("events", "ticks", "pathfinding", "collision", "draw", "text", "flip")
+
+
+class FrameProfiler:
+    # выключенный профайлер ничего не стоит: обертки ставятся только в attach и снимаются в detach
+    def __init__(self, history: int = 3600, overlay: bool = False, overlay_every: int = 30):
+        self.history = history
+        self.overlay = overlay
+        self.overlay_every = overlay_every
+        self.phase_index = {name: i for i, name in enumerate(PHASES)}
+        # кольцевые буферы по кадрам, секунды
+        self.frame_times = np.zeros(history)
+        self.phase_times = np.zeros((history, len(PHASES)))
+        self.path_calls = np.zeros(history, dtype=np.int32)
+        self.frames = 0
+        self.current = [0.0] * len(PHASES)
+        self.current_calls = 0
+        self.stack = []
+        self.frame_start = None
+        self.wrapped = []
+        self.text = ""
+
+    def attach(self, render: Render, controller: GameController = None):
+        simulation = render.simulation
+        self.wrap(render, "handle_events", "events")
+        self.wrap(simulation, "step", "ticks")
+        self.wrap(render, "draw_frame", "draw")
+        self.wrap(render, "display_text", "text")
+        self.wrap(render, "present", "flip")
+        self.wrap(simulation.get_spatial_hash(), "query", "collision")
+        if simulation.get_collision_grid() is not None:
+            self.wrap(simulation.get_collision_grid(), "collides", "collision")
+        if controller is not None:
+            # одиночные пути, векторные шаги GhostAI и общее поле погони считаются одним запросом пути
+            self.wrap(controller.p, "get_path", "pathfinding", count=True)
+            self.wrap(controller.p, "next_steps", "pathfinding", count=True)
+            if controller.chase_field is not None:
+                self.wrap(controller.chase_field, "update", "pathfinding")
+            if controller.ghost_ai is not None:
+                self.wrap(controller.ghost_ai, "update", "pathfinding")
+            if simulation.planner is not None:
+                self.wrap(simulation.planner, "collect", "pathfinding")
+        render.profiler = self
+        return self
+
+    def detach(self, render: Render):
+        for obj, name in self.wrapped:
+            del obj.__dict__[name]
+        self.wrapped = []
+        render.profiler = None
+
+    def wrap(self, obj, name: str, phase: str, count: bool = False):
+        # подменяем метод у экземпляра; время вложенных фаз вычитается из внешней
+        function = getattr(obj, name)
+        index = self.phase_index[phase]
+        current = self.current
+        stack = self.stack
+
+        def timed(*args, **kwargs):
+            if count:
+                self.current_calls += 1
+            stack.append(0.0)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                current[index] += elapsed - stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+
+        setattr(obj, name, timed)
+        self.wrapped.append((obj, name))
+
+    def begin_frame(self):
+        self.frame_start = perf_counter()
+
+    def end_frame(self):
+        slot = self.frames % self.history
+        self.frame_times[slot] = perf_counter() - self.frame_start
+        self.phase_times[slot] = self.current
+        self.path_calls[slot] = self.current_calls
+        for i in range(len(self.current)):
+            self.current[i] = 0.0
+        self.current_calls = 0
+        self.frames += 1
+        if self.overlay and self.frames % self.overlay_every == 0:
+            stats = self.summary()
+            self.text = (f"frame p50 {stats['frame_ms_p50']:.2f} p95 {stats['frame_ms_p95']:.2f} "
+                         f"p99 {stats['frame_ms_p99']:.2f} ms | paths {stats['path_calls_per_sec']:.0f}/s")
+
+    def overlay_text(self):
+        return self.text
+
+    def window(self):
+        # кадры в порядке записи, не больше history последних
+        count = min(self.frames, self.history)
+        order = np.arange(self.frames - count, self.frames) % self.history
+        return self.frame_times[order], self.phase_times[order], self.path_calls[order]
+
+    def summary(self):
+        frame_times, phase_times, path_calls = self.window()
+        if len(frame_times) == 0:
+            return {"frames": 0}
+        p50, p95, p99 = np.percentile(frame_times, (50, 95, 99)) * 1000
+        total = frame_times.sum()
+        return {
+            "frames": len(frame_times),
+            "frame_ms_p50": float(p50),
+            "frame_ms_p95": float(p95),
+            "frame_ms_p99": float(p99),
+            "frame_ms_max": float(frame_times.max() * 1000),
+            "phase_ms_mean": {name: float(phase_times[:, i].mean() * 1000) for i, name in enumerate(PHASES)},
+            "path_calls_per_sec": float(path_calls.sum() / total) if total else 0.0,
+        }
+
+    def save_csv(self, path):
+        frame_times, phase_times, path_calls = self.window()
+        first = self.frames - len(frame_times)
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(("frame", "frame_ms") + tuple(name + "_ms" for name in PHASES) + ("path_calls",))
+            for i in range(len(frame_times)):
+                writer.writerow([first + i, round(frame_times[i] * 1000, 4)]
+                                + [round(value * 1000, 4) for value in phase_times[i]] + [int(path_calls[i])])
+
+    def save_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play the game with per-phase frame profiling")
+    parser.add_argument("--fps", type=int, default=120)
+    parser.add_argument("--overlay", action="store_true", help="draw frame time percentiles on screen")
+    parser.add_argument("--full-frames", action="store_true", help="redraw the whole screen every frame")
+    parser.add_argument("--csv", default=None, help="write per-frame timings to this file")
+    parser.add_argument("--json", default=None, help="write the summary to this file")
+    args = parser.parse_args()
+
+    unified_size = 32
+    pacman_game = GameController(**GAME_OPTIONS)
+    size = pacman_game.size
+    simulation = Simulation(size[0] * unified_size, size[1] * unified_size, tick_rate=args.fps)
+    pacman_game.build_level(simulation, unified_size)
+    renderer = Render(simulation, dirty_rendering=not args.full_frames)
+    profiler = FrameProfiler(overlay=args.overlay).attach(renderer, pacman_game)
+    renderer.tick(args.fps)
+
+    print(json.dumps(profiler.summary(), indent=2))
+    if args.csv:
+        profiler.save_csv(args.csv)
+    if args.json:
+        profiler.save_json(args.json)
@@ -0,0 +1,174 @@
+import argparse
+import time
+
+import numpy as np
+
+from Pacman import GameController, Movement, Point, Powerup, Simulation, Wall
+from batch import MOVEMENTS
+
+EMPTY, WALL, COOKIE, POWERUP = range(4)
+PACMAN_OPEN = "images/paku.png"
+PACMAN_CLOSED = "images/man.png"
+FRIGHT = "images/ghost_fright.png"
+
+
+def load_sprite(path, size: int):
+    # pygame нужен только чтобы прочитать png; дисплей и видеодрайвер не создаются
+    import pygame
+    image = pygame.image.load(path)
+    scaled = pygame.transform.smoothscale(image, (size, size))
+    rgb = pygame.surfarray.array3d(scaled).transpose(1, 0, 2)
+    alpha = pygame.surfarray.array_alpha(scaled).T
+    return rgb.astype(np.float32), alpha.astype(np.float32)[..., None] / 255
+
+
+def disc_patch(size: int, radius: float, unified_size: int, color, supersample: int = 4):
+    # круг очка в центре клетки, края сглажены усреднением подвыборки
+    steps = (np.arange(size * supersample) + 0.5) / (size * supersample) * unified_size - unified_size / 2
+    inside = (steps[:, None] ** 2 + steps[None, :] ** 2) <= radius ** 2
+    coverage = inside.reshape(size, supersample, size, supersample).mean(axis=(1, 3))
+    return (coverage[..., None] * np.array(color, dtype=np.float32)).round().astype(np.uint8)
+
+
+class TileRasterizer:
+    # кадры для агентов чистым numpy: клетки из сетки, спрайты заранее уменьшены до pixels_per_tile
+    def __init__(self, controller: GameController, pixels_per_tile: int = 4, unified_size: int = 32):
+        self.p = pixels_per_tile
+        self.unified_size = unified_size
+        self.walls = np.asarray(controller.collision_grid.walls)
+        self.rows, self.cols = self.walls.shape
+        self.height = self.rows * self.p
+        self.width = self.cols * self.p
+        self.margin = self.p  # рамка под спрайты, ушедшие в туннель
+
+        self.patches = np.zeros((4, self.p, self.p, 3), dtype=np.uint8)
+        self.patches[WALL] = Wall.color
+        self.patches[COOKIE] = disc_patch(self.p, Point.size, unified_size, Point.color)
+        self.patches[POWERUP] = disc_patch(self.p, Powerup.size, unified_size, Powerup.color)
+
+        # атлас: premultiplied rgb и (1 - alpha) для каждого спрайта
+        self.sprite_ids = {}
+        colors, alphas = [], []
+        paths = list(controller.ghost_colors) + [FRIGHT]
+        for path in paths:
+            rgb, alpha = load_sprite(path, self.p)
+            self.sprite_ids[path] = len(colors)
+            colors.append(rgb * alpha)
+            alphas.append(1 - alpha)
+        for mouth_open, path in ((True, PACMAN_OPEN), (False, PACMAN_CLOSED)):
+            rgb, alpha = load_sprite(path, self.p)
+            for direction in Movement:
+                turns = (direction.value // 90) % 4
+                self.sprite_ids[(mouth_open, direction)] = len(colors)
+                colors.append(np.rot90(rgb * alpha, turns))
+                alphas.append(np.rot90(1 - alpha, turns))
+        self.premultiplied = np.array(colors, dtype=np.float32)
+        self.transparency = np.array(alphas, dtype=np.float32)
+        self.ghost_ids = np.array([self.sprite_ids[path] for path in controller.ghost_colors], dtype=np.int32)
+        self.pacman_ids = np.array([[self.sprite_ids[(mouth_open, direction)] for direction in MOVEMENTS]
+                                    for mouth_open in (False, True)], dtype=np.int32)
+        self.buffers = {}
+
+    def buffer(self, n: int):
+        if n not in self.buffers:
+            self.buffers[n] = np.zeros((n, self.height + 2 * self.margin, self.width + 2 * self.margin, 3),
+                                       dtype=np.uint8)
+        return self.buffers[n]
+
+    def compose(self, cookies, powerups, sprites, positions, visible):
+        # cookies/powerups: (n, rows, cols); sprites, visible: (n, e); positions: (n, e, 2) x, y в пикселях игры.
+        # Возвращает (n, height, width, 3) поверх переиспользуемого буфера
+        n = len(cookies)
+        frames = self.buffer(n)
+        m = self.margin
+        interior = frames[:, m:m + self.height, m:m + self.width]
+
+        kind = cookies.astype(np.uint8) * COOKIE
+        kind[powerups] = POWERUP
+        kind[:, self.walls] = WALL
+        tiles = interior.reshape(n, self.rows, self.p, self.cols, self.p, 3)
+        tiles[...] = self.patches[kind].transpose(0, 1, 3, 2, 4, 5)
+
+        # спрайты по одному слоту за раз, но сразу во всех играх; порядок слотов = порядок отрисовки
+        offsets = np.arange(self.p)
+        scaled = (np.asarray(positions) * self.p + self.unified_size // 2) // self.unified_size
+        limit = np.array((self.width + m, self.height + m))
+        scaled = np.clip(scaled + m, 0, limit)
+        for slot in range(sprites.shape[1]):
+            games = np.flatnonzero(visible[:, slot])
+            if len(games) == 0:
+                continue
+            ids = sprites[games, slot]
+            xs = scaled[games, slot, 0][:, None] + offsets
+            ys = scaled[games, slot, 1][:, None] + offsets
+            index = (games[:, None, None], ys[:, :, None], xs[:, None, :])
+            region = frames[index].astype(np.float32)
+            frames[index] = (region * self.transparency[ids] + self.premultiplied[ids]).astype(np.uint8)
+        return interior
+
+    def render(self, simulation: Simulation):
+        return self.render_batch([simulation])[0]
+
+    def render_batch(self, simulations):
+        n = len(simulations)
+        slots = max(len(simulation.get_ghosts()) for simulation in simulations) + 1
+        cookies = np.stack([simulation.get_pellets().cookies for simulation in simulations])
+        powerups = np.stack([simulation.get_pellets().powerups for simulation in simulations])
+        sprites = np.zeros((n, slots), dtype=np.int32)
+        positions = np.zeros((n, slots, 2), dtype=np.int32)
+        visible = np.zeros((n, slots), dtype=np.bool_)
+        for game, simulation in enumerate(simulations):
+            spatial_hash = simulation.get_spatial_hash()
+            frightened = simulation.is_powerup_active()
+            for slot, ghost in enumerate(simulation.get_ghosts()):
+                path = FRIGHT if frightened else ghost.normal_sprite_path
+                sprites[game, slot] = self.sprite_ids[path]
+                positions[game, slot] = ghost.x, ghost.y
+                visible[game, slot] = ghost in spatial_hash
+            pacman = simulation.pacman
+            if pacman is not None:
+                sprites[game, -1] = self.sprite_ids[(pacman.mouth_open, pacman.current_direction)]
+                positions[game, -1] = pacman.x, pacman.y
+                visible[game, -1] = True
+        return self.compose(cookies, powerups, sprites, positions, visible)
+
+    def render_batch_simulation(self, games):
+        # кадры сразу для всех партий batch.BatchSimulation
+        n, ghosts = games.ghost_alive.shape
+        sprites = np.empty((n, ghosts + 1), dtype=np.int32)
+        sprites[:, :ghosts] = np.where(games.powerup_active[:, None], self.sprite_ids[FRIGHT],
+                                       self.ghost_ids[np.arange(ghosts) % len(self.ghost_ids)])
+        mouth_open = (games.ticks // max(games.tick_rate // 5, 1)) % 2 == 0
+        sprites[:, ghosts] = self.pacman_ids[mouth_open.astype(np.int32), games.pacman_dir]
+        positions = np.concatenate([games.ghost_pos, games.pacman_pos[:, None]], axis=1)
+        visible = np.concatenate([games.ghost_alive, games.alive[:, None]], axis=1)
+        return self.compose(games.cookies, games.powerups, sprites, positions, visible)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure numpy frame rasterization speed")
+    parser.add_argument("--pixels-per-tile", type=int, default=4)
+    parser.add_argument("--games", type=int, default=64)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    from batch import BatchSimulation
+
+    controller = GameController()
+    rasterizer = TileRasterizer(controller, args.pixels_per_tile)
+    simulation = Simulation(controller.size[0] * 32, controller.size[1] * 32)
+    controller.build_level(simulation)
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        simulation.step()
+        rasterizer.render(simulation)
+    single = (time.perf_counter() - start) / args.frames
+
+    games = BatchSimulation(controller, args.games, seed=0)
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        games.step(games.rng.integers(0, 4, size=args.games))
+        frames = rasterizer.render_batch_simulation(games)
+    batched = (time.perf_counter() - start) / args.frames
+    print(f"{frames.shape[2]}x{frames.shape[1]} px: single game {single * 1e6:.0f} us/frame (with step), "
+          f"{args.games} batched games {batched * 1e6 / args.games:.1f} us/frame (with step)")
@@ -0,0 +1,204 @@
+import argparse
+import random
+import struct
+import time
+
+import numpy as np
+
+from Pacman import GAME_OPTIONS, GameController, Movement, Simulation, SimulationObserver, maze_hash
+
+MAGIC = b"PMRP"
+VERSION = 2
+PREFIX = struct.Struct("<4sH")
+# magic, версия, зерно, sha1 лабиринта, tick_rate, размер клетки, шаг контрольных точек,
+# chase_field, ghost_ai, planner_workers
+HEADER = struct.Struct("<4sHQ20sHHI??B")
+# версия 1 не хранила настроек и писалась до общего поля погони
+V1_HEADER = struct.Struct("<4sHQ20sHHI")
+V1_OPTIONS = {"chase_field": False, "ghost_ai": False, "planner_workers": 0}
+COUNT = struct.Struct("<I")
+# настройки GameController() по умолчанию
+DEFAULT_OPTIONS = {"chase_field": True, "ghost_ai": False, "planner_workers": 0}
+RUN_DTYPE = np.dtype([("action", "u1"), ("count", "<u4")])
+CHECKPOINT_DTYPE = np.dtype([("tick", "<u4"), ("hash", "<u8")])
+
+MOVEMENTS = list(Movement)
+NO_INPUT = 255
+
+
+def encode_action(action: Movement) -> int:
+    return NO_INPUT if action is None else MOVEMENTS.index(action)
+
+
+def decode_action(code: int):
+    return None if code == NO_INPUT else MOVEMENTS[code]
+
+
+class ReplayLog:
+    def __init__(self, seed: int, level_hash: bytes, tick_rate: int = 120, unified_size: int = 32,
+                 checkpoint_every: int = 120, runs=None, checkpoints=None, controller_options=None):
+        self.seed = seed
+        self.level_hash = level_hash
+        self.tick_rate = tick_rate
+        self.unified_size = unified_size
+        self.checkpoint_every = checkpoint_every
+        # ввод хранится сериями одинаковых действий: клавишу обычно держат много тиков подряд
+        self.runs = [] if runs is None else [tuple(run) for run in runs]
+        self.checkpoints = {} if checkpoints is None else dict(checkpoints)
+        # настройки GameController при записи: от них зависит поведение призраков
+        self.controller_options = dict(DEFAULT_OPTIONS if controller_options is None else controller_options)
+
+    @property
+    def ticks(self) -> int:
+        return sum(count for _, count in self.runs)
+
+    def append(self, action: Movement):
+        code = encode_action(action)
+        if self.runs and self.runs[-1][0] == code:
+            self.runs[-1] = (code, self.runs[-1][1] + 1)
+        else:
+            self.runs.append((code, 1))
+
+    def actions(self):
+        for code, count in self.runs:
+            action = decode_action(code)
+            for _ in range(count):
+                yield action
+
+    def save(self, path):
+        runs = np.array(self.runs, dtype=RUN_DTYPE)
+        checkpoints = np.array(sorted(self.checkpoints.items()), dtype=CHECKPOINT_DTYPE)
+        with open(path, "wb") as file:
+            options = self.controller_options
+            file.write(HEADER.pack(MAGIC, VERSION, self.seed, self.level_hash, self.tick_rate,
+                                   self.unified_size, self.checkpoint_every, options["chase_field"],
+                                   options["ghost_ai"], options["planner_workers"]))
+            file.write(COUNT.pack(len(runs)))
+            file.write(runs.tobytes())
+            file.write(COUNT.pack(len(checkpoints)))
+            file.write(checkpoints.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version = PREFIX.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a replay log")
+        if version == 1:
+            _, _, seed, level_hash, tick_rate, unified_size, checkpoint_every = V1_HEADER.unpack_from(data)
+            options = V1_OPTIONS
+            offset = V1_HEADER.size
+        elif version == VERSION:
+            (_, _, seed, level_hash, tick_rate, unified_size, checkpoint_every,
+             chase_field, ghost_ai, planner_workers) = HEADER.unpack_from(data)
+            options = {"chase_field": chase_field, "ghost_ai": ghost_ai, "planner_workers": planner_workers}
+            offset = HEADER.size
+        else:
+            raise ValueError(f"unsupported replay version {version}")
+        (run_count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        runs = np.frombuffer(data, dtype=RUN_DTYPE, count=run_count, offset=offset)
+        offset += runs.nbytes
+        (checkpoint_count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        checkpoints = np.frombuffer(data, dtype=CHECKPOINT_DTYPE, count=checkpoint_count, offset=offset)
+        return cls(seed, level_hash, tick_rate, unified_size, checkpoint_every, runs.tolist(),
+                   ((int(tick), int(value)) for tick, value in checkpoints.tolist()), options)
+
+
+def level_digest(controller: GameController) -> bytes:
+    return bytes.fromhex(maze_hash(controller.numpy_maze))
+
+
+def new_game(controller: GameController, seed: int, tick_rate: int = 120, unified_size: int = 32) -> Simulation:
+    size = controller.size
+    simulation = Simulation(size[0] * unified_size, size[1] * unified_size, tick_rate)
+    controller.build_level(simulation, unified_size, seed)
+    return simulation
+
+
+class Recorder(SimulationObserver):
+    # наблюдатель: пишет ввод каждого шага и хеш состояния на контрольных тиках
+    def __init__(self, simulation: Simulation, log: ReplayLog):
+        self.log = log
+        simulation.add_observer(self)
+
+    def on_step(self, simulation: Simulation):
+        self.log.append(simulation.last_action)
+        if simulation.ticks % self.log.checkpoint_every == 0:
+            self.log.checkpoints[simulation.ticks] = simulation.state_hash()
+
+
+def record(controller: GameController, seed: int = None, tick_rate: int = 120, unified_size: int = 32,
+           checkpoint_every: int = 120):
+    if seed is None:
+        seed = random.randrange(2 ** 63)
+    simulation = new_game(controller, seed, tick_rate, unified_size)
+    log = ReplayLog(seed, level_digest(controller), tick_rate, unified_size, checkpoint_every,
+                    controller_options=controller.options)
+    Recorder(simulation, log)
+    return simulation, log
+
+
+def play(log: ReplayLog, controller: GameController = None, render: bool = False, speed: float = 1.0,
+         verify: bool = True):
+    if controller is None:
+        controller = GameController(**log.controller_options)
+    for name in ("chase_field", "ghost_ai"):
+        # число потоков планировщика на ход игры не влияет, остальное должно совпасть
+        if controller.options[name] != log.controller_options[name]:
+            raise ValueError(f"replay was recorded with {name}={log.controller_options[name]}")
+    if level_digest(controller) != log.level_hash:
+        raise ValueError("replay was recorded on a different maze")
+    simulation = new_game(controller, log.seed, log.tick_rate, log.unified_size)
+
+    renderer = None
+    if render:
+        from Pacman import Render
+        renderer = Render(simulation, dirty_rendering=True)
+        fps = max(int(log.tick_rate * speed), 1)
+
+    mismatches = []
+    for action in log.actions():
+        simulation.step(action)
+        expected = log.checkpoints.get(simulation.ticks)
+        if expected is not None and simulation.state_hash() != expected:
+            if verify:
+                raise ValueError(f"replay diverged at tick {simulation.ticks}")
+            mismatches.append(simulation.ticks)
+        if renderer is not None:
+            renderer.handle_events()
+            if renderer.done:
+                break
+            renderer.draw_frame()
+            renderer.clock.tick(fps)
+    return simulation, mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record a game or replay a recorded log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="play a live game and save its input log")
+    record_parser.add_argument("log")
+    record_parser.add_argument("--seed", type=int, default=None)
+    record_parser.add_argument("--checkpoint-every", type=int, default=120)
+    play_parser = commands.add_parser("play", help="re-simulate a log and check its state hashes")
+    play_parser.add_argument("log")
+    play_parser.add_argument("--render", action="store_true")
+    play_parser.add_argument("--speed", type=float, default=1.0, help="playback speed when rendering")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        from Pacman import Render
+        game, replay_log = record(GameController(**GAME_OPTIONS), args.seed, checkpoint_every=args.checkpoint_every)
+        Render(game, dirty_rendering=True).tick(replay_log.tick_rate)
+        replay_log.save(args.log)
+        print(f"recorded {replay_log.ticks} ticks, {len(replay_log.runs)} input runs, seed {replay_log.seed}")
+    else:
+        replay_log = ReplayLog.load(args.log)
+        start = time.perf_counter()
+        game, _ = play(replay_log, render=args.render, speed=args.speed)
+        elapsed = time.perf_counter() - start
+        print(f"replayed {game.ticks} ticks in {elapsed:.2f}s ({game.ticks / elapsed:.0f} ticks/s), "
+              f"score {game.score}, lives {game.lives}, {len(replay_log.checkpoints)} checkpoints ok")
@@ -0,0 +1,141 @@
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Pacman import GameController, Movement, Simulation
+from dataset import TrajectoryWriter
+
+RESULT_FIELDS = (
+    ("seed", np.int64),
+    ("score", np.int32),
+    ("lives", np.int8),
+    ("ticks", np.int32),
+    ("won", np.bool_),
+)
+
+# лабиринт и таблицы путей строятся один раз на процесс
+_controller: GameController = None
+_writer: TrajectoryWriter = None
+
+
+def init_worker(path_cache_dir=None, dataset_dir=None, controller_options=None):
+    global _controller, _writer
+    # controller_options выбирает вариант ИИ призраков: chase_field, ghost_ai, planner_workers
+    _controller = GameController(path_cache_dir, **(controller_options or {}))
+    # у каждого процесса свой писатель и свои файлы чанков
+    _writer = TrajectoryWriter.for_controller(dataset_dir, _controller) if dataset_dir else None
+
+
+def random_policy(simulation: Simulation, rng: random.Random):
+    if simulation.ticks % 32 == 0:
+        return rng.choice((Movement.UP, Movement.DOWN, Movement.LEFT, Movement.RIGHT))
+    return None
+
+
+def play_game(controller: GameController, seed: int, max_ticks: int, policy=random_policy,
+              unified_size: int = 32, tick_rate: int = 120, writer: TrajectoryWriter = None):
+    rng = random.Random(seed)
+    size = controller.size
+    simulation = Simulation(size[0] * unified_size, size[1] * unified_size, tick_rate)
+    controller.build_level(simulation, unified_size, seed)
+    if writer is not None:
+        writer.attach(simulation)
+    while simulation.ticks < max_ticks:
+        if simulation.step(policy(simulation, rng)):
+            break
+    return seed, simulation.score, simulation.lives, simulation.ticks, simulation.get_won()
+
+
+def play_chunk(seeds, max_ticks: int, policy=random_policy):
+    if _controller is None:
+        init_worker()
+    rows = [play_game(_controller, seed, max_ticks, policy, writer=_writer) for seed in seeds]
+    if _writer is not None:
+        # пул не сообщает воркеру о завершении, поэтому недописанный чанк закрываем после каждой пачки
+        _writer.close()
+    return RolloutResults.from_rows(rows)
+
+
+class RolloutResults:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns["seed"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def from_rows(cls, rows):
+        columns = {}
+        for i, (name, dtype) in enumerate(RESULT_FIELDS):
+            columns[name] = np.array([row[i] for row in rows], dtype=dtype)
+        return cls(columns)
+
+    @classmethod
+    def concat(cls, parts):
+        parts = list(parts)
+        if not parts:
+            return cls.from_rows([])
+        return cls({name: np.concatenate([part.columns[name] for part in parts]) for name, _ in RESULT_FIELDS})
+
+    def summary(self):
+        if len(self) == 0:
+            return {"games": 0}
+        return {
+            "games": len(self),
+            "mean_score": float(self["score"].mean()),
+            "mean_lives": float(self["lives"].mean()),
+            "mean_ticks": float(self["ticks"].mean()),
+            "win_rate": float(self["won"].mean()),
+        }
+
+    def save(self, path):
+        np.savez_compressed(path, **self.columns)
+
+
+def run_rollouts(seeds, workers: int = None, max_ticks: int = 20000, policy=random_policy,
+                 chunk_size: int = 16, path_cache_dir=None, dataset_dir=None, controller_options=None):
+    seeds = list(seeds)
+    workers = workers or os.cpu_count() or 1
+    chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+    if workers == 1:
+        init_worker(path_cache_dir, dataset_dir, controller_options)
+        return RolloutResults.concat(play_chunk(chunk, max_ticks, policy) for chunk in chunks)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(path_cache_dir, dataset_dir, controller_options)) as pool:
+        parts = pool.map(play_chunk, chunks, [max_ticks] * len(chunks), [policy] * len(chunks))
+        return RolloutResults.concat(parts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play seeded headless games on a process pool")
+    parser.add_argument("--games", type=int, default=256)
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-ticks", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--dataset", default=None, help="record every transition into this directory")
+    parser.add_argument("--ghost-ai", action="store_true", help="move ghosts with the vectorized GhostAI")
+    parser.add_argument("--no-chase-field", action="store_true", help="plan every chase with its own path")
+    parser.add_argument("--planner-workers", type=int, default=0)
+    args = parser.parse_args()
+    options = {"ghost_ai": args.ghost_ai, "chase_field": not args.no_chase_field,
+               "planner_workers": args.planner_workers}
+
+    start = time.perf_counter()
+    results = run_rollouts(range(args.first_seed, args.first_seed + args.games), args.workers,
+                           args.max_ticks, chunk_size=args.chunk_size, dataset_dir=args.dataset,
+                           controller_options=options)
+    elapsed = time.perf_counter() - start
+    print(results.summary())
+    print(f"{len(results) / elapsed:.1f} games/s")
+    if args.output:
+        results.save(args.output)
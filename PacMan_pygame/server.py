@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import time
+
+import numpy as np
+
+from Pacman import GameController, Movement, Simulation, SimulationObserver
+
+# клиенту, у которого в буфере сокета больше этого, дельты не шлем, пока не догонит
+BACKLOG_LIMIT = 64 * 1024
+
+
+def encode(message) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def pack_cells(grid) -> str:
+    return base64.b64encode(np.packbits(grid).tobytes()).decode()
+
+
+def unpack_cells(data: str, shape):
+    bits = np.unpackbits(np.frombuffer(base64.b64decode(data), dtype=np.uint8), count=shape[0] * shape[1])
+    return bits.reshape(shape).astype(np.bool_)
+
+
+class DeltaTracker(SimulationObserver):
+    # наблюдатель партии: копит изменения за тик и отдает их одной дельтой для всех зрителей
+    def __init__(self, simulation: Simulation):
+        self.simulation = simulation
+        self.ids = {}
+        self.sent = {}  # id -> (x, y, direction), что видят клиенты
+        self.eaten_cookies = []
+        self.eaten_powerups = []
+        self.removed = []
+        self.reloaded = False
+        for movable in simulation.movables:
+            self.ids[movable] = len(self.ids)
+            self.sent[self.ids[movable]] = self.entity_state(movable)
+        self.scalars = self.current_scalars()
+        simulation.add_observer(self)
+
+    def on_add(self, obj):
+        if obj not in self.ids:
+            self.ids[obj] = len(self.ids)
+
+    def on_reset(self, simulation: Simulation):
+        self.reloaded = True
+
+    def on_remove(self, obj):
+        entity = self.ids.get(obj)
+        if entity is not None:
+            self.removed.append(entity)
+            self.sent.pop(entity, None)
+
+    def on_pellet_eaten(self, cell, powerup: bool):
+        (self.eaten_powerups if powerup else self.eaten_cookies).append(cell)
+
+    def entity_state(self, movable):
+        return movable.x, movable.y, movable.current_direction.name
+
+    def current_scalars(self):
+        simulation = self.simulation
+        return {"score": simulation.score, "lives": simulation.lives, "mode": simulation.current_mode.name,
+                "powerup": simulation.powerup_active, "won": simulation.won, "over": simulation.is_over()}
+
+    def keyframe(self):
+        simulation = self.simulation
+        pellets = simulation.get_pellets()
+        self.sent = {self.ids[movable]: self.entity_state(movable) for movable in simulation.movables}
+        self.scalars = self.current_scalars()
+        self.eaten_cookies = []
+        self.eaten_powerups = []
+        self.removed = []
+        self.reloaded = False
+        return {"type": "keyframe", "tick": simulation.ticks, "shape": list(pellets.cookies.shape),
+                "cookies": pack_cells(pellets.cookies), "powerups": pack_cells(pellets.powerups),
+                "entities": {entity: list(state) for entity, state in self.sent.items()},
+                "pacman": self.ids.get(simulation.pacman), **self.scalars}
+
+    def delta(self):
+        # None, если после restore нужен ключевой кадр
+        if self.reloaded:
+            return None
+        message = {"type": "delta", "tick": self.simulation.ticks}
+        moved = []
+        for movable in self.simulation.movables:
+            entity = self.ids[movable]
+            state = self.entity_state(movable)
+            if self.sent.get(entity) != state:
+                self.sent[entity] = state
+                moved.append([entity, *state])
+        if moved:
+            message["moved"] = moved
+        if self.eaten_cookies:
+            message["eaten_cookies"] = self.eaten_cookies
+            self.eaten_cookies = []
+        if self.eaten_powerups:
+            message["eaten_powerups"] = self.eaten_powerups
+            self.eaten_powerups = []
+        if self.removed:
+            message["removed"] = self.removed
+            self.removed = []
+        scalars = self.current_scalars()
+        for name, value in scalars.items():
+            if self.scalars.get(name) != value:
+                message[name] = value
+        self.scalars = scalars
+        return message
+
+
+class Client:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.session = None
+        self.needs_keyframe = True
+        self.sent_bytes = 0
+
+    def backlog(self) -> int:
+        return self.writer.transport.get_write_buffer_size()
+
+    def send(self, data: bytes):
+        self.writer.write(data)
+        self.sent_bytes += len(data)
+
+
+class GameSession:
+    def __init__(self, session_id: int, controller: GameController, unified_size: int = 32, tick_rate: int = 120):
+        self.session_id = session_id
+        size = controller.size
+        self.simulation = Simulation(size[0] * unified_size, size[1] * unified_size, tick_rate)
+        controller.build_level(self.simulation, unified_size)
+        self.tracker = DeltaTracker(self.simulation)
+        self.clients = set()
+        self.action = None
+
+    def step(self):
+        simulation = self.simulation
+        if not simulation.is_over():
+            simulation.step(self.action)
+        self.action = None
+        delta = self.tracker.delta()
+        if delta is None:
+            for client in self.clients:
+                client.needs_keyframe = True
+            delta_bytes = None
+        else:
+            delta_bytes = encode(delta)
+        keyframe_bytes = None
+        for client in self.clients:
+            if client.backlog() > BACKLOG_LIMIT:
+                # отстающий клиент пропускает дельты и потом получает ключевой кадр
+                client.needs_keyframe = True
+                continue
+            if client.needs_keyframe:
+                if keyframe_bytes is None:
+                    keyframe_bytes = encode({"session": self.session_id, **self.keyframe()})
+                client.send(keyframe_bytes)
+                client.needs_keyframe = False
+            elif delta_bytes is not None:
+                client.send(delta_bytes)
+
+    def keyframe(self):
+        # ключевой кадр строится от текущего состояния, дельта этого тика уже учтена
+        return self.tracker.keyframe()
+
+
+class GameServer:
+    def __init__(self, controller: GameController = None, tick_rate: int = 120):
+        self.controller = GameController() if controller is None else controller
+        self.tick_rate = tick_rate
+        self.sessions = {}
+        self.session_ids = itertools.count()
+        self.ticks = 0
+
+    def create_session(self) -> GameSession:
+        session = GameSession(next(self.session_ids), self.controller, tick_rate=self.tick_rate)
+        self.sessions[session.session_id] = session
+        return session
+
+    def step(self):
+        for session in list(self.sessions.values()):
+            session.step()
+        self.ticks += 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        next_tick = loop.time()
+        while True:
+            self.step()
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < -interval:
+                # не догоняем пропущенные тики пачкой
+                next_tick = loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = Client(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                self.dispatch(client, message)
+        except (ConnectionError, ValueError):
+            # ValueError здесь от readline: строка длиннее лимита потока
+            pass
+        finally:
+            self.leave(client)
+            writer.close()
+
+    def dispatch(self, client: Client, message):
+        # ввод от клиента не доверенный: все, что не похоже на команду, молча пропускаем
+        if not isinstance(message, dict):
+            return
+        op = message.get("op")
+        if op == "join":
+            session_id = message.get("session")
+            if session_id is not None and not isinstance(session_id, int):
+                client.send(encode({"type": "error", "error": "session must be an integer"}))
+                return
+            self.leave(client)
+            session = self.sessions.get(session_id) if session_id is not None else self.create_session()
+            if session is None:
+                client.send(encode({"type": "error", "error": f"no session {session_id}"}))
+                return
+            client.session = session
+            client.needs_keyframe = True
+            session.clients.add(client)
+        elif op == "input" and client.session is not None:
+            direction = message.get("dir")
+            valid = isinstance(direction, str) and direction in Movement.__members__
+            client.session.action = Movement[direction] if valid else None
+        elif op == "keyframe" and client.session is not None:
+            client.needs_keyframe = True
+
+    def leave(self, client: Client):
+        session = client.session
+        if session is None:
+            return
+        session.clients.discard(client)
+        client.session = None
+        if not session.clients:
+            del self.sessions[session.session_id]
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.run())
+
+
+class GameView:
+    # состояние партии на стороне клиента, собранное из ключевых кадров и дельт
+    def __init__(self):
+        self.tick = None
+        self.cookies = None
+        self.powerups = None
+        self.entities = {}
+        self.scalars = {}
+
+    def apply(self, message):
+        if message["type"] == "keyframe":
+            shape = message["shape"]
+            self.cookies = unpack_cells(message["cookies"], shape)
+            self.powerups = unpack_cells(message["powerups"], shape)
+            self.entities = {int(entity): tuple(state) for entity, state in message["entities"].items()}
+        elif message["type"] == "delta":
+            if self.cookies is None:
+                return
+            for entity, x, y, direction in message.get("moved", ()):
+                self.entities[entity] = (x, y, direction)
+            for col, row in message.get("eaten_cookies", ()):
+                self.cookies[row, col] = False
+            for col, row in message.get("eaten_powerups", ()):
+                self.powerups[row, col] = False
+            for entity in message.get("removed", ()):
+                self.entities.pop(entity, None)
+        else:
+            return
+        self.tick = message["tick"]
+        for name in ("score", "lives", "mode", "powerup", "won", "over"):
+            if name in message:
+                self.scalars[name] = message[name]
+
+
+async def watch(host: str, port: int, session=None, seconds: float = 5.0, control: bool = False):
+    # простой клиент по loopback: смотрит партию и при желании жмет случайные стрелки
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({"op": "join", "session": session}))
+    view = GameView()
+    received = 0
+    directions = [direction.name for direction in (Movement.UP, Movement.DOWN, Movement.LEFT, Movement.RIGHT)]
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            line = await asyncio.wait_for(reader.readline(), deadline - time.perf_counter())
+        except asyncio.TimeoutError:
+            break
+        if not line:
+            break
+        received += len(line)
+        view.apply(json.loads(line))
+        if control and view.tick is not None and view.tick % 32 == 0:
+            writer.write(encode({"op": "input", "dir": directions[view.tick // 32 % 4]}))
+    writer.close()
+    return view, received
+
+
+async def loopback(clients: int, seconds: float, port: int, tick_rate: int):
+    server = GameServer(tick_rate=tick_rate)
+    listener = await asyncio.start_server(server.handle_client, "127.0.0.1", port)
+    ticker = asyncio.ensure_future(server.run())
+    results = await asyncio.gather(*(watch("127.0.0.1", port, seconds=seconds, control=True)
+                                     for _ in range(clients)))
+    ticker.cancel()
+    listener.close()
+    received = sum(size for _, size in results)
+    print(f"{clients} sessions, {server.ticks} server ticks ({server.ticks / seconds:.0f}/s), "
+          f"{received / clients / max(server.ticks, 1):.1f} bytes per session per tick")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host games over a local socket and stream state deltas")
+    parser.add_argument("command", choices=("serve", "watch", "loopback"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tick-rate", type=int, default=120)
+    parser.add_argument("--session", type=int, default=None, help="session to watch, a new one by default")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=100, help="loopback sessions to open")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(GameServer(tick_rate=args.tick_rate).serve(args.host, args.port))
+    elif args.command == "watch":
+        final_view, total = asyncio.run(watch(args.host, args.port, args.session, args.seconds))
+        print(f"tick {final_view.tick}, {final_view.scalars}, {total} bytes received")
+    else:
+        asyncio.run(loopback(args.clients, args.seconds, args.port, args.tick_rate))
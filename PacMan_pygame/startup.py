@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ("headless", "windowed")
+
+
+def cold_start(mode: str):
+    # выполняется в свежем процессе: от импорта до первого тика или кадра
+    start = time.perf_counter()
+    phases = {}
+    from Pacman import GameController, Simulation
+    phases["import"] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    controller = GameController()
+    simulation = Simulation(controller.size[0] * 32, controller.size[1] * 32)
+    controller.build_level(simulation)
+    phases["build"] = time.perf_counter() - mark
+
+    if mode == "windowed":
+        mark = time.perf_counter()
+        from Pacman import Render
+        renderer = Render(simulation, dirty_rendering=True)
+        phases["window"] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    simulation.step()
+    if mode == "windowed":
+        renderer.draw_frame()
+    phases["first_tick"] = time.perf_counter() - mark
+    phases["total"] = time.perf_counter() - start
+    phases["pygame_loaded"] = "pygame" in sys.modules
+    phases["tcod_loaded"] = "tcod" in sys.modules
+    return phases
+
+
+def measure(mode: str, runs: int):
+    env = dict(os.environ)
+    if mode == "windowed":
+        env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, __file__, "--child", mode], env=env, check=True,
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        phases = json.loads(output.strip().splitlines()[-1])
+        phases["process"] = time.perf_counter() - start
+        samples.append(phases)
+    timings = [name for name, value in samples[0].items() if not isinstance(value, bool)]
+    result = {name + "_ms": statistics.median(sample[name] for sample in samples) * 1000 for name in timings}
+    result.update({"mode": mode, "runs": runs, "pygame_loaded": samples[0]["pygame_loaded"],
+                   "tcod_loaded": samples[0]["tcod_loaded"]})
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold start latency of headless and windowed launches")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--json", default=None, help="write the medians to this file")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(cold_start(args.child)))
+        sys.exit(0)
+
+    results = []
+    for launch_mode in args.modes.split(","):
+        result = measure(launch_mode, args.runs)
+        timings = " ".join(f"{name[:-3]}={value:.1f}ms" for name, value in result.items() if name.endswith("_ms"))
+        print(f"{launch_mode}: {timings} | pygame={result['pygame_loaded']} tcod={result['tcod_loaded']}")
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import numpy as np
+
+from Pacman import Movement
+from server import GameServer, GameView, encode
+
+# клетка O в верхнем левом углу стандартного лабиринта, под ней прямой коридор
+POWERUP_CELL = (6, 3)
+
+
+async def open_client(server: GameServer):
+    listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    return listener, reader, writer
+
+
+async def wait_until(condition, what: str):
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError(f"server never saw {what}")
+
+
+async def play_over_loopback(ticks: int, garbage=(), directions=("UP", "LEFT", "DOWN", "RIGHT"), setup=None):
+    # сервер шагает вручную, чтобы после каждого тика клиент получал ровно одно сообщение
+    server = GameServer()
+    listener, reader, writer = await open_client(server)
+    for line in garbage:
+        writer.write(line)
+    writer.write(encode({"op": "join"}))
+    await wait_until(lambda: server.sessions, "the join")
+    session = next(iter(server.sessions.values()))
+    if setup is not None:
+        setup(session.simulation)
+    view = GameView()
+    for tick in range(ticks):
+        direction = None
+        if tick % 32 == 0:
+            direction = directions[tick // 32 % len(directions)]
+            writer.write(encode({"op": "input", "dir": direction}))
+            await wait_until(lambda: session.action == Movement[direction], f"input {direction}")
+        server.step()
+        if direction is not None:
+            assert session.simulation.last_action == Movement[direction]
+        while True:
+            message = json.loads(await asyncio.wait_for(reader.readline(), 5))
+            if message["type"] != "error":
+                break
+        view.apply(message)
+    writer.close()
+    listener.close()
+    return session, view
+
+
+def assert_view_matches(session, view: GameView):
+    simulation = session.simulation
+    pellets = simulation.get_pellets()
+    assert view.tick == simulation.ticks
+    assert np.array_equal(view.cookies, pellets.cookies)
+    assert np.array_equal(view.powerups, pellets.powerups)
+    ids = session.tracker.ids
+    expected = {ids[movable]: (movable.x, movable.y, movable.current_direction.name)
+                for movable in simulation.movables}
+    assert view.entities == expected
+    assert view.scalars["score"] == simulation.score
+    assert view.scalars["lives"] == simulation.lives
+
+
+def test_view_rebuilt_from_deltas_matches_server():
+    session, view = asyncio.run(play_over_loopback(600))
+    assert session.simulation.score > 0
+    assert_view_matches(session, view)
+
+
+def test_cookie_eaten_under_active_powerup_keeps_powerup():
+    # при активном энерджайзере Пакман съедает на клетке O только очко
+    def walk_through_powerup(simulation):
+        col, row = POWERUP_CELL
+        simulation.pacman.set_position(col * 32, (row + 2) * 32)
+        simulation.active_powerup()
+
+    session, view = asyncio.run(play_over_loopback(120, directions=("UP",), setup=walk_through_powerup))
+    col, row = POWERUP_CELL
+    pellets = session.simulation.get_pellets()
+    assert session.simulation.pacman.y < row * 32
+    assert not pellets.cookies[row, col] and pellets.powerups[row, col]
+    assert_view_matches(session, view)
+
+
+def test_malformed_messages_do_not_drop_client():
+    garbage = (b"[1]\n", b'"join"\n', encode({"op": "input", "dir": ["UP"]}),
+               encode({"op": "join", "session": ["x"]}), b"{not json\n")
+    session, view = asyncio.run(play_over_loopback(120, garbage))
+    assert_view_matches(session, view)